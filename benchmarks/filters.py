@@ -0,0 +1,186 @@
+from argparse import ArgumentParser
+import logging
+from pathlib import Path
+import random
+import re
+import sys
+import timeit
+
+from jinja2 import Environment, pass_context
+
+# The plugin is imported from this repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pelican.plugins.pelican_renn_plugin import jinja_filters  # noqa: E402
+from pelican.plugins.pelican_renn_plugin.thumbnail import (  # noqa: E402
+    path_to_dict,
+    ResizeSpec,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+LANGUAGES = ("en", "fr", "de", "es", "it")
+RESIZES = {
+    "square": (150, True),
+    "wide": (150, None, True),
+    "tall": (None, 150, True),
+}
+SAVE_AS = "{parent}/thumbnails/{stem}_{resize}{suffix}"
+
+# A listing of articles, as in the theme: the flag of each translation, the links of
+# the projects and the thumbnails of their images
+TEMPLATE = """\
+{% for article in articles %}
+<article>
+  {% for lang in article.langs %}<span>{{ lang|get_flag_emoji }}</span>{% endfor %}
+  {% for link in article.links %}
+    {% set title, uri = link|parse_link %}<a href="{{ uri }}">{{ title }}</a>
+  {% endfor %}
+  {% for image in article.images %}
+    {% for resize in resizes %}<img src="{{ image|get_thumbnail(resize) }}">{% endfor %}
+  {% endfor %}
+</article>
+{% endfor %}
+"""
+
+
+def reference_parse_link(raw):
+    """
+    `parse_link` before its results were cached, to compare with.
+    """
+
+    match = re.match(r"^(.*)\s*<([^>]+)>$", raw)
+    if not match:
+        return raw, ""
+    uri = match[2]
+    title = match[1] if match[1] else match[2]
+    return title.strip(), uri.strip()
+
+
+def reference_get_flag_emoji(code):
+    """
+    `get_flag_emoji` before its results were cached, to compare with.
+    """
+
+    if code == "en":
+        code = "gb"
+
+    return "".join([chr(127397 + ord(c)) for c in list(code.upper())])
+
+
+@pass_context
+def reference_get_thumbnail(ctx, path, resize):
+    """
+    `get_thumbnail` before its results were cached, to compare with.
+    """
+
+    resize_settings = ctx.get("THUMBNAIL_RESIZES")
+    if not resize_settings:
+        return path
+    resize_spec = resize_settings.get(resize)
+    if not resize_spec:
+        return path
+
+    return ctx["THUMBNAIL_SAVE_AS"].format(
+        resize=resize,
+        resize_spec=str(ResizeSpec(resize_spec)),
+        **path_to_dict(path)
+    )
+
+
+FILTERS = {
+    "reference": {
+        "parse_link": reference_parse_link,
+        "get_flag_emoji": reference_get_flag_emoji,
+        "get_thumbnail": reference_get_thumbnail,
+    },
+    "current": {
+        "parse_link": jinja_filters.parse_link,
+        "get_flag_emoji": jinja_filters.get_flag_emoji,
+        "get_thumbnail": jinja_filters.get_thumbnail,
+    },
+}
+
+
+def workload(articles, seed=0):
+    """
+    :param articles: Number of articles of the listing.
+    :param seed: Seed of the random content.
+    :return: The context of the template, and the links of the articles.
+    """
+
+    rng = random.Random(seed)
+    # Projects link to a few sites, and use a few images
+    links = [f"Project {i} <https://example.com/projects/{i}/>" for i in range(100)] \
+        + [f"https://example.org/{i}/" for i in range(50)]
+    images = [f"images/image-{i}.jpg" for i in range(40)]
+    context = {
+        "articles": [
+            {
+                "langs": rng.sample(LANGUAGES, rng.randint(1, len(LANGUAGES))),
+                "links": rng.sample(links, 4),
+                "images": rng.sample(images, 2),
+            }
+            for _ in range(articles)
+        ],
+        "resizes": list(RESIZES),
+        "THUMBNAIL_RESIZES": RESIZES,
+        "THUMBNAIL_SAVE_AS": SAVE_AS,
+    }
+    return context, [link for article in context["articles"]
+                     for link in article["links"]]
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the Jinja filters of the plugin "
+                                        "against their uncached implementation.")
+    parser.add_argument("--articles", type=int, default=500,
+                        help="Number of articles of the rendered listing.")
+    parser.add_argument("--number", type=int, default=20,
+                        help="Number of renders per measure.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of measures, the fastest one is kept.")
+    args = parser.parse_args()
+
+    context, links = workload(args.articles)
+    results = dict()
+    for name, filters in FILTERS.items():
+        env = Environment()
+        env.filters.update(filters)
+        template = env.from_string(TEMPLATE)
+        parse_link = filters["parse_link"]
+        rendered = template.render(context)
+        results[name] = {
+            # Bound as defaults, so that each measure uses the filters of its scenario
+            "template": min(timeit.repeat(
+                lambda template=template: template.render(context),
+                number=args.number,
+                repeat=args.repeat,
+            )) / args.number,
+            # As the `project` directive parses its links
+            "directive": min(timeit.repeat(
+                lambda parse_link=parse_link: [parse_link(link) for link in links],
+                number=args.number,
+                repeat=args.repeat,
+            )) / args.number,
+            "output": rendered,
+        }
+
+    if results["reference"]["output"] != results["current"]["output"]:
+        raise SystemExit("The filters don't render the same output as the reference")
+
+    calls = sum(len(article["langs"]) + len(article["links"])
+                + len(article["images"]) * len(RESIZES)
+                for article in context["articles"])
+    logger.info(f"{args.articles} articles, {calls} filter calls per render")
+    for workload_name in ("template", "directive"):
+        reference = results["reference"][workload_name]
+        current = results["current"][workload_name]
+        logger.info(f"{workload_name:<10} {reference * 1e3:8.2f}ms -> "
+                    f"{current * 1e3:8.2f}ms ({reference / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+from argparse import ArgumentParser
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import statistics
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
+from synthetic_site import generate_site
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+BENCHMARKS_PATH = Path(__file__).resolve().parent
+STUBS_PATH = BENCHMARKS_PATH/"stubs"
+DEFAULT_BASELINE = BENCHMARKS_PATH.parent/".benchmarks/baseline.json"
+
+PLUGIN_MODULE = "pelican.plugins.pelican_renn_plugin"
+
+# Features enabled by each scenario (see `FEATURES` in the generated `pelicanconf.py`).
+# The reST reader and the projects directive are timed by every scenario.
+SCENARIOS = {
+    "reader": "",
+    "hidden_categories": "hidden_categories",
+    "noindex_categories": "noindex_categories",
+    "overrides": "overrides",
+    "thumbnails": "thumbnails",
+    "tailwindcss": "tailwindcss",
+    "i18n_subsites": "i18n_subsites",
+    "i18n_subsites_parallel": "i18n_subsites,i18n_subsites_parallel",
+    "all": "all",
+}
+
+
+def build(site, features, profile):
+    """
+    Build a site in a Pelican subprocess, with the stub Tailwind CSS CLI.
+
+    :param site: Path of the site.
+    :param features: Comma-separated features to enable.
+    :param profile: Path of the profiling report of the build.
+    :return: The profiling report.
+    :raise RuntimeError: If the build fails.
+    """
+
+    shutil.rmtree(site/"output", ignore_errors=True)
+    env = os.environ | {
+        "RENN_BENCHMARK_FEATURES": features,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(STUBS_PATH),
+                                                    os.environ.get("PYTHONPATH")])),
+    }
+    process = subprocess.run(
+        [sys.executable, "-m", "pelican", "content", "-s", "pelicanconf.py",
+         "-o", "output", "-q", "-e", f"RENN_PROFILE={json.dumps(str(profile))}"],
+        cwd=site,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if process.returncode:
+        raise RuntimeError(f"The build of '{features}' failed:\n{process.stdout}"
+                           f"{process.stderr}")
+    return json.loads(profile.read_text())
+
+
+def import_time():
+    """
+    Measure the time it takes to import the plugin in a new interpreter, once Pelican
+    is imported.
+
+    :return: The cumulative import time of the plugin package, in seconds.
+    :raise RuntimeError: If the import fails.
+    """
+
+    env = os.environ | {
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(BENCHMARKS_PATH.parent),
+                                                    os.environ.get("PYTHONPATH")])),
+    }
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import pelican; import {PLUGIN_MODULE}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if process.returncode:
+        raise RuntimeError(f"The import of the plugin failed:\n{process.stderr}")
+    # Lines are like "import time: <self us> | <cumulative us> | <package>"
+    for line in process.stderr.splitlines():
+        *_, cumulative, module = line.split("|")
+        if module.strip() == PLUGIN_MODULE:
+            return int(cumulative) / 1e6
+    raise RuntimeError("The import time of the plugin was not reported")
+
+
+def run_benchmarks(site, rounds, scenarios):
+    """
+    Time each scenario. The time of a build is the wall time of the plugin profiler,
+    i.e. from the initialization of Pelican to the end of its finalization, so that the
+    startup of the interpreter is not included.
+
+    :param site: Path of the site.
+    :param rounds: Number of builds per scenario.
+    :param scenarios: Names of the scenarios to run.
+    :return: The results, by scenario.
+    """
+
+    results = dict()
+    times = [import_time() for _ in range(max(rounds, 5))]
+    results["import"] = {
+        "median": statistics.median(times),
+        "min": min(times),
+        "runs": times,
+        "spans": dict(),
+    }
+    logger.info(f"{"import":<24} {results["import"]["median"]:8.3f}s "
+                f"(min {results["import"]["min"]:.3f}s)")
+
+    for name in scenarios:
+        reports = [build(site, SCENARIOS[name], site/f"profile-{name}.json")
+                   for _ in range(rounds)]
+        times = [report["wall_time"] for report in reports]
+        fastest = min(reports, key=lambda report: report["wall_time"])
+        results[name] = {
+            "median": statistics.median(times),
+            "min": min(times),
+            "runs": times,
+            "spans": {span: stats["wall_time"]
+                      for span, stats in fastest["spans"].items()},
+        }
+        logger.info(f"{name:<24} {results[name]["median"]:8.3f}s "
+                    f"(min {results[name]["min"]:.3f}s)")
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """
+    Compare the results with a baseline.
+
+    :param results: Results of the benchmarks.
+    :param baseline: Results of the baseline.
+    :param tolerance: Relative slowdown allowed before a scenario regresses.
+    :param min_delta: Absolute slowdown in seconds below which a scenario never
+    regresses, since short builds are noisy.
+    :return: The names of the regressed scenarios.
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]["median"]
+        delta = result["median"] - reference
+        ratio = result["median"]/reference if reference else 1
+        regressed = ratio > 1 + tolerance and delta > min_delta
+        logger.info(f"{name:<24} {reference:8.3f}s -> {result["median"]:8.3f}s "
+                    f"({ratio - 1:+.1%}){" REGRESSION" if regressed else ""}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the plugin features on a "
+                                        "synthetic site.")
+    parser.add_argument("--articles", type=int, default=100,
+                        help="Number of articles.")
+    parser.add_argument("--images", type=int, default=20, help="Number of images.")
+    parser.add_argument("--languages", type=int, default=3,
+                        help="Number of languages.")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Number of builds per scenario.")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run, can be repeated. The default is all "
+                             "the scenarios.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE,
+                        help="Path of the baseline results.")
+    parser.add_argument("--save", action="store_true",
+                        help="Save the results as the new baseline instead of "
+                             "comparing them.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown allowed, e.g. 0.2 for 20%%.")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="Absolute slowdown in seconds that is always allowed.")
+    parser.add_argument("--import-budget", type=float, default=0.01,
+                        help="Maximum time in seconds to import the plugin, once "
+                             "Pelican is imported.")
+    parser.add_argument("--site", type=Path,
+                        help="Directory of the synthetic site, which is kept. The "
+                             "default is a temporary directory.")
+    args = parser.parse_args()
+
+    parameters = {
+        "articles": args.articles,
+        "images": args.images,
+        "languages": args.languages,
+        "python": sys.version.split()[0],
+    }
+    baseline = None
+    if not args.save:
+        if not args.baseline.exists():
+            raise SystemExit(f"No baseline at {args.baseline}, run with --save first")
+        baseline = json.loads(args.baseline.read_text())
+        if baseline["parameters"] != parameters:
+            raise SystemExit(f"The baseline was recorded with {baseline["parameters"]}, "
+                             f"not {parameters}; run with --save to replace it")
+
+    with TemporaryDirectory(prefix="renn-benchmark-") as tmp:
+        site = generate_site(args.site or Path(tmp)/"site", args.articles, args.images,
+                             args.languages)
+        results = run_benchmarks(site, args.rounds, args.scenario or SCENARIOS)
+
+    if results["import"]["median"] > args.import_budget:
+        raise SystemExit(f"Importing the plugin took {results["import"]["median"]:.3f}s, "
+                         f"over the budget of {args.import_budget:.3f}s")
+
+    if args.save:
+        # Scenarios that weren't run keep their previous baseline
+        if (args.baseline.exists()
+            and (previous := json.loads(args.baseline.read_text()))["parameters"]
+                == parameters):
+            results = previous["scenarios"] | results
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({"parameters": parameters,
+                                             "scenarios": results}, indent=2))
+        logger.info(f"Baseline saved to {args.baseline}")
+        return
+
+    if regressions := compare(results, baseline["scenarios"], args.tolerance,
+                              args.min_delta):
+        raise SystemExit(f"Performance regression in: {", ".join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# Offline stand-in for `pytailwindcss`, used by the benchmarks. It runs a stub Tailwind
+# CSS CLI, which only copies (and minifies) its input file, in a subprocess, so that
+# the plugin is timed with the same process overhead without downloading anything.
+
+import shlex
+import subprocess
+import sys
+
+from . import utils
+
+__all__ = ["install", "run", "utils"]
+
+
+def install(version="latest"):
+    """
+    :param version: Version of the CLI, ignored.
+    """
+
+
+def run(tailwindcss_cli_args, env=None, cwd=None, live_output=False,
+        version="latest"):
+    """
+    Run the stub CLI.
+
+    :param tailwindcss_cli_args: Arguments of the CLI.
+    :param env: Environment of the CLI.
+    :param cwd: Working directory of the CLI.
+    :param live_output: Whether to show the output of the CLI instead of capturing it.
+    :param version: Version of the CLI.
+    :return: A `subprocess.CompletedProcess` instance.
+    """
+
+    return subprocess.run(
+        [sys.executable, utils.get_bin_path(version),
+         *shlex.split(tailwindcss_cli_args)],
+        env=env,
+        cwd=cwd,
+        capture_output=not live_output,
+        check=False,
+    )
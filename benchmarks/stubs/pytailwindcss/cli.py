@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from pathlib import Path
+import re
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Stub Tailwind CSS CLI.")
+    parser.add_argument("-i", "--input", type=Path, required=True)
+    parser.add_argument("-o", "--output", type=Path, required=True)
+    parser.add_argument("-c", "--config", type=Path)
+    parser.add_argument("--minify", action="store_true")
+    args = parser.parse_args()
+
+    css = args.input.read_text()
+    if args.minify:
+        css = re.sub(r"\s+", " ", css).strip()
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(css)
@@ -0,0 +1,10 @@
+from pathlib import Path
+
+
+def get_bin_path(version="latest"):
+    """
+    :param version: Version of the CLI, ignored.
+    :return: Path of the stub CLI.
+    """
+
+    return Path(__file__).with_name("cli.py")
@@ -0,0 +1,239 @@
+from argparse import ArgumentParser
+from pathlib import Path
+import random
+import shutil
+
+PLUGINS_PATH = Path(__file__).resolve().parent.parent/"pelican/plugins"
+
+LANGUAGES = ("en", "fr", "de", "es", "it", "nl", "pt", "pl", "sv", "fi")
+CATEGORIES = ("work", "blog", "misc")
+TAGS = ("python", "pelican", "web", "photo", "travel", "music")
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing",
+         "elit", "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore",
+         "et", "dolore", "magna", "aliqua")
+
+# Settings of the site. Each feature of the plugin that can be benchmarked is enabled
+# by its settings in `FEATURES`; the reST reader and the projects directive are always
+# enabled.
+PELICANCONF = '''\
+import os
+
+AUTHOR = "Benchmark"
+SITENAME = "Synthetic site"
+SITEURL = ""
+PATH = "content"
+# Translations are only read by the i18n subsites, which handle them
+ARTICLE_PATHS = ["articles"]
+PAGE_PATHS = ["pages"]
+TIMEZONE = "UTC"
+DEFAULT_LANG = "{default_lang}"
+PLUGIN_PATHS = [{plugins_path!r}]
+PLUGINS = ["pelican_renn_plugin", "patched_i18n_subsites"]
+STATIC_PATHS = ["images", "css"]
+FEED_ALL_ATOM = None
+CATEGORY_FEED_ATOM = None
+TRANSLATION_FEED_ATOM = None
+AUTHOR_FEED_ATOM = None
+AUTHOR_FEED_RSS = None
+DEFAULT_PAGINATION = 10
+
+FEATURES = {{
+    "hidden_categories": {{
+        "HIDDENCATEGORY_ENABLE": True,
+    }},
+    "noindex_categories": {{
+        "NOINDEX_CATEGORIES": ["misc"],
+    }},
+    "overrides": {{
+        "OVERRIDES": {{
+            ("about", "Page"): {{"SITENAME": "About"}},
+            ("work", "Category"): {{"SITENAME": "Work"}},
+            ("work", "HiddenCategory"): {{"SITENAME": "All work"}},
+            ("python", "Tag"): {{"SITENAME": "Python"}},
+            ("benchmark", "Author"): {{"SITENAME": "Author"}},
+            ("index", "DirectTemplate"): {{"SITENAME": "Home"}},
+            **{{(f"article-{{i}}", "Article"): {{"SITENAME": f"Article {{i}}"}}
+               for i in range(0, {articles}, 10)}},
+        }},
+    }},
+    "thumbnails": {{
+        "THUMBNAIL_ENABLE": True,
+    }},
+    "tailwindcss": {{
+        "TAILWINDCSS_ENABLE": True,
+        # A pinned version doesn't require the GitHub API
+        "TAILWINDCSS_VERSION": "v4.0.0",
+        "TAILWINDCSS_INPUT_FILES": [os.path.join(os.path.dirname(__file__),
+                                                 "content/css/main.css")],
+    }},
+    "i18n_subsites": {{
+        "ARTICLE_PATHS": ["articles", "translations/articles"],
+        "PAGE_PATHS": ["pages", "translations/pages"],
+        "I18N_SUBSITES": {{lang: {{}} for lang in {languages!r}}},
+    }},
+    "i18n_subsites_parallel": {{
+        "I18N_SUBSITES_PARALLEL": True,
+    }},
+}}
+
+# Comma-separated features to enable, or "all"
+features = os.environ.get("RENN_BENCHMARK_FEATURES", "")
+for feature in FEATURES if features == "all" else filter(None, features.split(",")):
+    globals().update(FEATURES[feature])
+'''
+
+
+def _sentence(rng, length):
+    """
+    :param rng: Random generator.
+    :param length: Number of words.
+    :return: A sentence of random words.
+    """
+
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def _write_images(path, count, rng):
+    """
+    Write random JPEG images.
+
+    :param path: Directory of the images.
+    :param count: Number of images.
+    :param rng: Random generator.
+    :return: The names of the images.
+    """
+
+    if not count:
+        return []
+
+    from PIL import Image, ImageDraw  # noqa: PLC0415
+
+    path.mkdir(parents=True, exist_ok=True)
+    names = []
+    for i in range(count):
+        image = Image.new("RGB", (rng.randint(800, 1600), rng.randint(600, 1200)),
+                          tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(20):
+            x, y = rng.randrange(image.width), rng.randrange(image.height)
+            draw.rectangle((x, y, x + rng.randint(20, 400), y + rng.randint(20, 400)),
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        names.append(f"image-{i}.jpg")
+        image.save(path/names[-1], quality=85)
+    return names
+
+
+def _article(index, lang, images, rng):
+    """
+    :param index: Index of the article.
+    :param lang: Language of the article.
+    :param images: Names of the images the projects may use.
+    :param rng: Random generator.
+    :return: The reST source of an article.
+    """
+
+    category = CATEGORIES[index % len(CATEGORIES)]
+    title = f"Article {index} ({lang})"
+    lines = [
+        title,
+        "#" * len(title),
+        "",
+        f":date: 2024-01-01 {index // 60 % 24:02}:{index % 60:02}",
+        f":slug: article-{index}",
+        f":lang: {lang}",
+        f":category: {category}",
+        f":tags: {", ".join(rng.sample(TAGS, 2))}",
+    ]
+    # A quarter of the work articles are hidden from the listings
+    if category == "work" and index % 4 == 0:
+        lines.append(":status: hidden")
+    lines += ["", _sentence(rng, 40), "", ".. projects::", ""]
+
+    for project in range(rng.randint(1, 4)):
+        lines.append(f"    .. project:: Project {index}.{project}")
+        if images:
+            lines.append(f"        :image: images/{rng.choice(images)}")
+        lines += [
+            "        :links: Website <https://example.com/>, https://example.org/",
+            "",
+            f"        {_sentence(rng, 20)}",
+            "",
+        ]
+    lines += [_sentence(rng, 60), ""]
+    return "\n".join(lines)
+
+
+def generate_site(path, articles=100, images=20, languages=1, seed=0):
+    """
+    Generate a synthetic site exercising every feature of the plugin: reST articles
+    with `projects` directives, hidden and no-index categories, overrides, images to
+    thumbnail, a Tailwind CSS input file and translations.
+
+    :param path: Directory of the site. It is replaced if it exists.
+    :param articles: Number of articles in the default language.
+    :param images: Number of images.
+    :param languages: Number of languages, including the default one. Every other
+    article is translated to each additional language, which becomes an i18n subsite.
+    :param seed: Seed of the random content.
+    :return: Path of the site.
+    """
+
+    if not 1 <= languages <= len(LANGUAGES):
+        raise ValueError(f"The number of languages must be between 1 and "
+                         f"{len(LANGUAGES)}")
+
+    path = Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+    content = path/"content"
+    rng = random.Random(seed)
+
+    image_names = _write_images(content/"images", images, rng)
+
+    (content/"css").mkdir(parents=True)
+    (content/"css/main.css").write_text(
+        "@import \"tailwindcss\";\n\n"
+        + "\n".join(f".block-{i} {{ @apply p-{i % 8} m-{i % 4}; }}" for i in range(200))
+    )
+
+    default_lang, *other_langs = LANGUAGES[:languages]
+    for kind in ("articles", "pages"):
+        (content/kind).mkdir()
+        (content/"translations"/kind).mkdir(parents=True)
+
+    for lang in LANGUAGES[:languages]:
+        directory = "pages" if lang == default_lang else "translations/pages"
+        (content/f"{directory}/about-{lang}.rst").write_text(
+            f"About\n#####\n\n:slug: about\n:lang: {lang}\n\n{_sentence(rng, 50)}\n"
+        )
+
+    for index in range(articles):
+        (content/f"articles/article-{index}-{default_lang}.rst").write_text(
+            _article(index, default_lang, image_names, rng)
+        )
+        # Every other article is translated
+        for lang in other_langs if index % 2 == 0 else []:
+            (content/f"translations/articles/article-{index}-{lang}.rst").write_text(
+                _article(index, lang, image_names, rng)
+            )
+
+    (path/"pelicanconf.py").write_text(PELICANCONF.format(
+        default_lang=default_lang,
+        plugins_path=str(PLUGINS_PATH),
+        articles=articles,
+        languages=tuple(other_langs),
+    ))
+    return path
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Generate a synthetic site to benchmark the "
+                                        "plugin.")
+    parser.add_argument("path", type=Path, help="Directory of the site.")
+    parser.add_argument("--articles", type=int, default=100,
+                        help="Number of articles.")
+    parser.add_argument("--images", type=int, default=20, help="Number of images.")
+    parser.add_argument("--languages", type=int, default=1,
+                        help="Number of languages.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the content.")
+    args = parser.parse_args()
+    generate_site(args.path, args.articles, args.images, args.languages, args.seed)
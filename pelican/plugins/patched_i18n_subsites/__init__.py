@@ -1,6 +1,12 @@
-from pelican import StaticGenerator
+import logging
+
+from pelican import StaticGenerator, signals
 from pelican.plugins.i18n_subsites import i18n_subsites as _i18n_subsites
 
+from . import dedupe, parallel
+
+_LOGGER = logging.getLogger(__name__)
+
 interlink_static_files = None
 
 def prune_shared_static_files(generator):
@@ -20,6 +26,8 @@ def prune_shared_static_files(generator):
 
     If `generator` is not a `StaticGenerator`, it only calls the original
     `interlink_static_files`.
+
+    The number of files that the subsite doesn't copy is logged.
     """
 
     global interlink_static_files
@@ -28,7 +36,7 @@ def prune_shared_static_files(generator):
     # Also, we are only concerned with the static generator
     if (not generator.settings["STATIC_PATHS"]
         and isinstance(generator, StaticGenerator)):
-        marked_for_deletion = []
+        marked_for_deletion = set()
         # We fetch the static content from the context
         static_content = generator.context["static_content"]
         # For each main static file
@@ -36,14 +44,20 @@ def prune_shared_static_files(generator):
             # If it exists in the subsite static generator
             if (key := static_file.get_relative_source_path()) in static_content:
                 # We mark it for deletion in generator.staticfiles
-                marked_for_deletion.append(key)
+                marked_for_deletion.add(key)
                 # We also remove the key from the context
                 static_content.pop(key)
 
-        # Finally, we remove these files from generator.staticfiles as well
-        for static_file in reversed(generator.staticfiles):
-            if static_file.url in marked_for_deletion:
-                generator.staticfiles.remove(static_file)
+        # Finally, we remove these files from generator.staticfiles as well, in place
+        # since the generator context references the same list
+        if marked_for_deletion:
+            generator.staticfiles[:] = [
+                static_file for static_file in generator.staticfiles
+                if static_file.get_relative_source_path() not in marked_for_deletion
+            ]
+        _LOGGER.info(f"renn: Subsite {generator.settings["DEFAULT_LANG"]} links to "
+                     f"{len(marked_for_deletion)} static files of the main site "
+                     f"instead of copying them")
 
     # Finally, we call the original interlink_static_files to finish processing
     interlink_static_files(generator)
@@ -52,7 +66,9 @@ def prune_shared_static_files(generator):
 def register():
     """
     Store a backup of the original interlink_static_files, then patch the i18n-subsites
-    module, and proceed with the original register function.
+    module, and proceed with the original register function. Subsites may be built in
+    parallel, and the static files deduplication is registered last, so that it runs
+    once all the subsites are written.
     """
 
     global interlink_static_files
@@ -60,8 +76,16 @@ def register():
         interlink_static_files = _i18n_subsites.interlink_static_files
     _i18n_subsites.interlink_static_files = prune_shared_static_files
 
+    _i18n_subsites._SIGNAL_HANDLERS_DB["get_writer"] = parallel.create_next_subsite
+
     _i18n_subsites.register()
 
+    signals.initialized.connect(parallel.set_default_settings)
+    signals.initialized.connect(dedupe.set_default_settings)
+    signals.static_generator_finalized.connect(dedupe.save_static_generator)
+    parallel.subsite_worker_finalized.connect(dedupe.collect_static_outputs)
+    signals.finalized.connect(dedupe.dedupe_static_files)
+
 
 def __getattr__(name):
     """
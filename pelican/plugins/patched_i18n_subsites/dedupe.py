@@ -0,0 +1,221 @@
+from collections import defaultdict
+import errno
+from functools import partial
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+
+from pelican.plugins.i18n_subsites import i18n_subsites as _i18n_subsites
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# ioctl request that clones the extents of a file (Linux, e.g. Btrfs and XFS)
+FICLONE = 0x40049409
+# Errors meaning that a link method isn't supported between two paths
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+                errno.EPERM, errno.EMLINK}
+
+# Static generators of the main site and of the subsites, in build order
+_STATIC_GENERATORS = []
+# Static outputs of the subsites built in worker processes
+_STATIC_OUTPUTS = []
+
+
+def set_default_settings(instance):
+    """
+    Signal that initializes the default settings of the deduplication.
+
+    :param instance: The Pelican instance.
+    """
+
+    instance.settings.setdefault("I18N_STATIC_DEDUPE", False)
+
+
+def save_static_generator(generator):
+    """
+    Signal that saves the static generator of each site, so that its output can be
+    deduplicated once all the sites are written.
+
+    :param generator: A `StaticGenerator` instance.
+    """
+
+    if generator.settings["I18N_STATIC_DEDUPE"]:
+        _STATIC_GENERATORS.append(generator)
+
+
+def _static_outputs(generator):
+    """
+    List the static files written by a site: its static files and its theme static
+    files.
+
+    :param generator: A `StaticGenerator` instance.
+    :return: A generator of paths.
+    """
+
+    output_path = Path(generator.output_path)
+    for static_file in generator.staticfiles:
+        yield output_path/static_file.save_as
+
+    theme_static_path = output_path/generator.settings["THEME_STATIC_DIR"]
+    # Subsites may link to the theme static files of the main site
+    if (theme_static_path.is_dir()
+        and theme_static_path.resolve().is_relative_to(output_path.resolve())):
+        for dirpath, _, filenames in theme_static_path.walk():
+            for filename in filenames:
+                yield dirpath/filename
+
+
+def collect_static_outputs(pelican_obj):
+    """
+    Signal sent in a subsite worker process, which hands the static outputs of the
+    subsite to the main process.
+
+    :param pelican_obj: The Pelican instance of the subsite.
+    :return: A callable that merges the outputs in the main process.
+    """
+
+    if not pelican_obj.settings["I18N_STATIC_DEDUPE"]:
+        return None
+
+    # The static generator of the main site was inherited from the main process
+    lang = pelican_obj.settings["DEFAULT_LANG"]
+    paths = [str(path) for generator in _STATIC_GENERATORS
+             if generator.settings["DEFAULT_LANG"] == lang
+             for path in _static_outputs(generator)]
+    return partial(_merge_static_outputs, paths)
+
+
+def _merge_static_outputs(paths, pelican_obj):
+    """
+    :param paths: Static outputs of a subsite built in a worker process.
+    :param pelican_obj: The main Pelican instance.
+    """
+
+    _STATIC_OUTPUTS.extend(Path(path) for path in paths)
+
+
+def _file_digest(path):
+    """
+    :param path: Path of the file.
+    :return: The SHA-256 digest of the file.
+    """
+
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").digest()
+
+
+def _reflink(source, target):
+    """
+    Create `target` as a copy-on-write clone of `source`.
+
+    :param source: Path of the source file.
+    :param target: Path of the new file.
+    :raise OSError: If the filesystem doesn't support reflinks.
+    """
+
+    if not fcntl:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    # The clone is a new file, so it keeps the metadata of the file it replaces
+    shutil.copystat(source, target)
+
+
+def _replace(source, target, methods):
+    """
+    Replace a file by a reflink or a hardlink to an identical file.
+
+    :param source: Path of the file to keep.
+    :param target: Path of the duplicate file.
+    :param methods: Names of the methods to try, in order; a method that isn't
+    supported by the filesystem is removed from the list.
+    :return: Name of the method that was used, or `None` if the copy is kept.
+    """
+
+    temporary = target.with_name(f".{target.name}.renn-dedupe")
+    for method in list(methods):
+        try:
+            if method == "reflink":
+                _reflink(source, temporary)
+            else:
+                os.link(source, temporary)
+        except OSError as e:
+            temporary.unlink(missing_ok=True)
+            if e.errno not in _UNSUPPORTED:
+                raise
+            # Hardlinks only fail between devices, which depends on the files
+            if method == "reflink":
+                methods.remove(method)
+            continue
+        os.replace(temporary, target)
+        return method
+    return None
+
+
+def dedupe_static_files(instance):
+    """
+    Once the main site and all its subsites are written, replace the identical static
+    files of their outputs by reflinks when the filesystem supports them, by hardlinks
+    otherwise, or keep the copies if neither can be created.
+
+    Pelican (and the Tailwind CSS CLI) overwrite existing outputs in place, which would
+    write through a hardlink into the files of the other sites, so hardlinks are only
+    used when `DELETE_OUTPUT_DIRECTORY` ensures each build starts from new files.
+
+    :param instance: The Pelican instance.
+    """
+
+    # Subsites are written while the main site requests its writer, so the main site
+    # is the last one to be finalized
+    if (not instance.settings["I18N_STATIC_DEDUPE"]
+        or instance.settings["DEFAULT_LANG"] != _i18n_subsites._MAIN_LANG):
+        return
+
+    outputs = [path for generator in _STATIC_GENERATORS
+               for path in _static_outputs(generator)] + _STATIC_OUTPUTS
+    _STATIC_GENERATORS.clear()
+    _STATIC_OUTPUTS.clear()
+
+    # Files can only be identical if they have the same size, so only those are hashed
+    by_size = defaultdict(list)
+    seen = set()
+    for path in outputs:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        if (stat.st_dev, stat.st_ino) not in seen:
+            seen.add((stat.st_dev, stat.st_ino))
+            by_size[stat.st_size].append(path)
+
+    methods = ["reflink", "hardlink"] if instance.settings["DELETE_OUTPUT_DIRECTORY"] \
+        else ["reflink"]
+    counts = defaultdict(int)
+    saved = 0
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        by_digest = defaultdict(list)
+        for path in paths:
+            by_digest[_file_digest(path)].append(path)
+
+        # The first file is the one of the earliest site, i.e. the main site if it
+        # has it
+        for source, *duplicates in by_digest.values():
+            for target in duplicates:
+                method = _replace(source, target, methods)
+                counts[method] += 1
+                if method:
+                    saved += size
+
+    if counts:
+        _LOGGER.info(f"renn: Deduplicated the static files of the subsites: "
+                     f"{counts["reflink"]} reflinks, {counts["hardlink"]} hardlinks, "
+                     f"{counts[None]} copies kept, {saved} bytes saved")
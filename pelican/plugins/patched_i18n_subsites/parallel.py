@@ -0,0 +1,186 @@
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing
+
+from blinker import signal
+from pelican.plugins.i18n_subsites import i18n_subsites as _i18n_subsites
+from pelican.settings import configure_settings
+
+_LOGGER = logging.getLogger(__name__)
+
+# Sent in a subsite worker once its subsite is written. Receivers return a picklable
+# callable, which is called in the main process with the main Pelican instance so
+# that the results of the worker are merged back (e.g. a `functools.partial` of a
+# module-level function).
+subsite_worker_finalized = signal("i18n_subsite_worker_finalized")
+
+# Original handler of the `get_writer` signal
+_create_next_subsite = _i18n_subsites.create_next_subsite
+# Connection to the main process, in a subsite worker
+_worker_connection = None
+# Native content URLs inherited from the main process, in a subsite worker
+_inherited_urls = None
+
+
+def set_default_settings(instance):
+    """
+    Signal that initializes the default settings of the parallel subsites.
+
+    :param instance: The Pelican instance.
+    """
+
+    instance.settings.setdefault("I18N_SUBSITES_PARALLEL", False)
+
+
+class _Dispatcher:
+    """
+    Handler of the log records of the subsite workers, which dispatches them to the
+    handlers of the main process. The records were already filtered by the loggers of
+    the workers.
+    """
+
+    @staticmethod
+    def handle(record):
+        logging.getLogger(record.name).callHandlers(record)
+
+
+def _run_subsite(lang, overrides, connection, log_queue):
+    """
+    Build a subsite in a worker process. The worker sends the native URLs of its
+    content to the main process, and waits for those of all the sites before its
+    content is interlinked and written. Once it is written, the results of the
+    `subsite_worker_finalized` receivers are sent to the main process.
+
+    :param lang: Language of the subsite.
+    :param overrides: Settings overrides of the subsite.
+    :param connection: Connection to the main process.
+    :param log_queue: Queue receiving the log records.
+    """
+
+    global _worker_connection, _inherited_urls
+
+    # Log records are handled by the main process
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+
+    # This worker only builds its own subsite, with the databases of the main site
+    _worker_connection = connection
+    _i18n_subsites._SUBSITE_QUEUE.clear()
+    _i18n_subsites._GENERATOR_DB.clear()
+    _inherited_urls = _i18n_subsites._NATIVE_CONTENT_URL_DB.copy()
+
+    with _i18n_subsites.temporary_locale():
+        settings = _i18n_subsites._MAIN_SETTINGS.copy()
+        settings.update(overrides)
+        settings = configure_settings(settings)
+        cls = _i18n_subsites.get_pelican_cls(settings)
+
+        pelican_obj = cls(settings)
+        _LOGGER.debug(f"renn: Generating i18n subsite for language '{lang}' using "
+                      f"class {cls} in process {multiprocessing.current_process().pid}")
+        pelican_obj.run()
+
+    connection.send([merge for _, merge
+                     in subsite_worker_finalized.send(pelican_obj) if merge])
+    connection.close()
+
+
+def _exchange_native_urls():
+    """
+    In a subsite worker, send the native URLs of the subsite to the main process,
+    merge those of all the sites, and interlink the content of the subsite.
+    """
+
+    _worker_connection.send({
+        source_path: url
+        for source_path, url in _i18n_subsites._NATIVE_CONTENT_URL_DB.items()
+        if _inherited_urls.get(source_path) != url
+    })
+    _i18n_subsites._NATIVE_CONTENT_URL_DB.update(_worker_connection.recv())
+    _i18n_subsites.update_generators()
+
+
+def _create_subsites(pelican_obj):
+    """
+    In the main process, build all the subsites in parallel worker processes.
+
+    :param pelican_obj: The main Pelican instance.
+    """
+
+    context = multiprocessing.get_context("fork")
+    log_queue = context.Queue()
+    workers = []
+    while _i18n_subsites._SUBSITE_QUEUE:
+        lang, overrides = _i18n_subsites._SUBSITE_QUEUE.popitem()
+        connection, worker_connection = context.Pipe()
+        process = context.Process(target=_run_subsite, name=f"i18n-subsite-{lang}",
+                                  args=(lang, overrides, worker_connection, log_queue))
+        process.start()
+        worker_connection.close()
+        workers.append((lang, process, connection))
+
+    listener = QueueListener(log_queue, _Dispatcher())
+    listener.start()
+    try:
+        # Every site needs the native URLs of all the sites to interlink its content
+        for lang, _, connection in workers:
+            try:
+                _i18n_subsites._NATIVE_CONTENT_URL_DB.update(connection.recv())
+            except EOFError:
+                raise RuntimeError(f"The worker of the i18n subsite '{lang}' failed "
+                                   f"before its content was generated") from None
+        for _, _, connection in workers:
+            connection.send(_i18n_subsites._NATIVE_CONTENT_URL_DB)
+
+        # Interlink the content of the main site, as the last subsite would
+        _i18n_subsites.update_generators()
+        _i18n_subsites._MAIN_SETTINGS = None
+
+        # Wait for the subsites to be written and merge their results back; a worker
+        # that failed leaves its subsite missing or partial, which fails the build
+        # once every worker is done
+        failed = []
+        for lang, process, connection in workers:
+            try:
+                for merge in connection.recv():
+                    merge(pelican_obj)
+            except EOFError:
+                failed.append(lang)
+            process.join()
+            if process.exitcode:
+                _LOGGER.error(f"renn: The worker of the i18n subsite '{lang}' failed "
+                              f"with exit code {process.exitcode}")
+                if lang not in failed:
+                    failed.append(lang)
+        if failed:
+            raise RuntimeError(f"The worker of the i18n subsite(s) "
+                               f"{", ".join(f"'{lang}'" for lang in failed)} failed "
+                               f"after their content was generated")
+    finally:
+        for _, process, connection in workers:
+            connection.close()
+            process.join()
+        listener.stop()
+
+
+def create_next_subsite(pelican_obj):
+    """
+    Replacement of the `get_writer` handler of i18n-subsites. With
+    `I18N_SUBSITES_PARALLEL`, the main site builds all the subsites in parallel worker
+    processes, and each worker exchanges the native content URLs with the main site
+    instead of building the next subsite. Otherwise, the original handler builds the
+    subsites one after the other.
+
+    :param pelican_obj: The Pelican instance.
+    """
+
+    if _worker_connection:
+        _exchange_native_urls()
+    elif (pelican_obj.settings["I18N_SUBSITES_PARALLEL"]
+          and _i18n_subsites._SUBSITE_QUEUE
+          and "fork" in multiprocessing.get_all_start_methods()):
+        _create_subsites(pelican_obj)
+    else:
+        _create_next_subsite(pelican_obj)
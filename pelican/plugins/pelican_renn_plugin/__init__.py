@@ -1,21 +1,139 @@
 import os
+from functools import partial
 from importlib import import_module
 
+from blinker import signal
 from pelican import signals, ArticlesGenerator
-from docutils.parsers.rst import directives
-from pelican.plugins.i18n_subsites import article2draft
 
-from .jinja_filters import parse_link, get_flag_emoji, register_filters
-from .projects_directive import ProjectsDirective, ProjectDirective, register_templates
-from .hidden_category import create_hidden_categories
-from .noindex_category import patch_generate_direct_templates
-from .tailwindcss import load_tailwind, compile_css
-from .html5_reader import patch_reader
-from .thumbnail import generate_thumbnails, load_pillow
-from .overrides import (override_page_context, restore_page_context,
-                        patch_generate_categories)
+from .profiling import profiled
 
+# Features of the plugin: the settings predicate that enables a feature, its module,
+# the handlers called with each Pelican instance once it is initialized, and the map of
+# signal names to the handlers connected to them. Handlers are connected when the
+# plugin is registered, so that they keep their order relative to the handlers of the
+# other plugins (e.g. the deduplication of patched_i18n_subsites runs after the
+# post-processing stages), but features are only imported, and their handlers called,
+# for the sites that enable them.
+_FEATURES = [
+    (lambda settings: True, "jinja_filters", [], {
+        "generator_init": "register_filters",
+    }),
+    (lambda settings: True, "projects_directive", ["register_directives"], {
+        "generator_init": "register_templates",
+        "finalized": "write_fragments",
+    }),
+    (lambda settings: settings["HIDDENCATEGORY_ENABLE"], "hidden_category", [], {
+        "article_generator_finalized": "create_hidden_categories",
+    }),
+    (lambda settings: (settings["NOINDEX_CATEGORIES"] or settings["OVERRIDES"]
+                       or settings["WRITE_WORKERS"] != 1),
+     "noindex_category", [], {
+         "article_generator_init": "patch_generate_direct_templates",
+     }),
+    # Compiling the CSS is a post-processing stage
+    (lambda settings: settings["TAILWINDCSS_ENABLE"], "tailwindcss",
+     ["load_tailwind"], {}),
+    # The directives rely on the build context the wrapped reader activates
+    (lambda settings: True, "html5_reader", [], {
+        "readers_init": "patch_reader",
+    }),
+    (lambda settings: settings["RST_READ_WORKERS"] != 1, "html5_reader", [], {
+        "article_generator_init": "prefetch_sources",
+        "all_generators_finalized": "finish_prefetch",
+    }),
+    # Sources loaded from Pelican's content cache aren't read, at either caching layer
+    (lambda settings: settings["CACHE_CONTENT"] or settings["LOAD_CONTENT_CACHE"],
+     "html5_reader", [], {
+         "readers_init": "patch_content_cache",
+         "generator_init": "patch_content_cache",
+     }),
+    # Generating the thumbnails is a post-processing stage
+    (lambda settings: settings["THUMBNAIL_ENABLE"], "thumbnail", ["load_pillow"], {
+        # Sent by the patched i18n-subsites plugin when subsites are built in parallel
+        "i18n_subsite_worker_finalized": "collect_subsite_images",
+    }),
+    (lambda settings: settings["OVERRIDES"], "overrides", ["compile_overrides"], {
+        "all_generators_finalized": "check_overrides",
+    }),
+    (lambda settings: settings["OVERRIDES"] or settings["WRITE_WORKERS"] != 1,
+     "overrides", [], {
+         "page_generator_init": "patch_pages_generator",
+     }),
+    # Hidden categories are paginated with their own dates, and the listings are
+    # indexed once, by the patched articles generator
+    (lambda settings: (settings["OVERRIDES"] or settings["WRITE_WORKERS"] != 1
+                       or settings["HIDDENCATEGORY_ENABLE"]),
+     "overrides", [], {
+         "article_generator_init": "patch_articles_generator",
+     }),
+    # Overrides may only be set for some sites, so those that match nothing are reported
+    # once every site is built
+    (lambda settings: True, "overrides", [], {
+        "finalized": "report_unused_overrides",
+        "i18n_subsite_worker_finalized": "collect_override_matches",
+    }),
+    # Runs the stages registered by the features above
+    (lambda settings: settings["TAILWINDCSS_ENABLE"] or settings["THUMBNAIL_ENABLE"],
+     "postprocessing", [], {
+         "finalized": "run_stages",
+     }),
+    # Saved once the stages that depend on it have run
+    (lambda settings: settings["RENN_INCREMENTAL"] or settings["RENN_AUTORELOAD"],
+     "dependencies", [], {
+        "finalized": "save_dependencies",
+    }),
+    (lambda settings: settings["RENN_DRY_RUN"], "plan", [], {
+        "finalized": "write_plan",
+        "i18n_subsite_worker_finalized": "collect_plan",
+    }),
+    (lambda settings: settings["RENN_PROFILE"], "profiling", [], {
+        "finalized": "write_profile",
+        "i18n_subsite_worker_finalized": "collect_profile",
+    }),
+]
 
+# Public names of the plugin, imported from their module when they are first accessed
+_EXPORTS = {
+    "parse_link": "jinja_filters",
+    "get_flag_emoji": "jinja_filters",
+    "register_filters": "jinja_filters",
+    "ProjectsDirective": "projects_directive",
+    "ProjectDirective": "projects_directive",
+    "register_templates": "projects_directive",
+    "write_fragments": "projects_directive",
+    "create_hidden_categories": "hidden_category",
+    "patch_generate_direct_templates": "noindex_category",
+    "load_tailwind": "tailwindcss",
+    "compile_css": "tailwindcss",
+    "patch_reader": "html5_reader",
+    "prefetch_sources": "html5_reader",
+    "finish_prefetch": "html5_reader",
+    "patch_content_cache": "html5_reader",
+    "generate_thumbnails": "thumbnail",
+    "load_pillow": "thumbnail",
+    "collect_subsite_images": "thumbnail",
+    "compile_overrides": "overrides",
+    "check_overrides": "overrides",
+    "patch_pages_generator": "overrides",
+    "patch_articles_generator": "overrides",
+    "report_unused_overrides": "overrides",
+    "post_processing_stage": "postprocessing",
+    "run_stages": "postprocessing",
+    "save_dependencies": "dependencies",
+    "write_plan": "plan",
+    "collect_plan": "plan",
+    "write_profile": "profiling",
+    "collect_profile": "profiling",
+}
+
+
+def __getattr__(name):
+    if module := _EXPORTS.get(name):
+        return getattr(import_module(f".{module}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@profiled
 def set_default_settings(instance):
     """
     Signal that initializes our plugin default settings.
@@ -23,6 +141,13 @@ def set_default_settings(instance):
     :param instance: The Pelican instance.
     """
 
+    # Projects directive
+    instance.settings.setdefault("PROJECTS_LAZY_POPOVERS", None)
+    instance.settings.setdefault("PROJECTS_FRAGMENTS_PATH", "fragments")
+    instance.settings.setdefault("PROJECTS_IMAGE_RESIZES", [])
+    instance.settings.setdefault("PROJECTS_IMAGE_SIZES",
+                                 "(min-width: 1024px) 25vw, 50vw")
+
     # Hidden categories settings
     instance.settings.setdefault("HIDDENCATEGORY_ENABLE", False)
     instance.settings.setdefault("HIDDENCATEGORY_NAME", "{base_category} (full)")
@@ -38,6 +163,8 @@ def set_default_settings(instance):
     )
     instance.settings.setdefault("HIDDENCATEGORY_EXCLUDES", [])
 
+    article2draft = import_module("pelican.plugins.i18n_subsites").article2draft
+
     # We need to update this parameter so that the i18n subsites plugin takes into account hidden articles in its untranslated policy
     instance.settings.setdefault("I18N_GENERATORS_INFO", {
         ArticlesGenerator: {
@@ -58,9 +185,13 @@ def set_default_settings(instance):
     instance.settings.setdefault("TAILWINDCSS_CONFIG", None)
     instance.settings.setdefault("TAILWINDCSS_INPUT_FILES", [])
     instance.settings.setdefault("TAILWINDCSS_MINIFY", True)
+    instance.settings.setdefault("TAILWINDCSS_CLASS_FINGERPRINT", False)
 
     # HTML 5
     instance.settings.setdefault("HTML5_ENABLE", True)
+    instance.settings.setdefault("RST_CACHE_ENABLE", False)
+    instance.settings.setdefault("RST_CACHE_PATH", None)
+    instance.settings.setdefault("RST_READ_WORKERS", 1)
 
     # Thumbnail
     instance.settings.setdefault("THUMBNAIL_ENABLE", False)
@@ -74,39 +205,92 @@ def set_default_settings(instance):
         "tall": (None, 150, True),  # Keep aspect ratio and set height to 150px
     })
     instance.settings.setdefault("THUMBNAIL_SKIP_EXISTING", True)
+    instance.settings.setdefault("THUMBNAIL_CACHE_ENABLE", False)
+    instance.settings.setdefault("THUMBNAIL_CACHE_PATH", None)
+    instance.settings.setdefault("THUMBNAIL_WORKERS", 1)
+    instance.settings.setdefault("THUMBNAIL_MAX_PIXELS", None)
+    instance.settings.setdefault("THUMBNAIL_MEMORY_BUDGET", None)
 
     # Overrides
     instance.settings.setdefault("OVERRIDES", dict())
+    instance.settings.setdefault("WRITE_WORKERS", 1)
 
+    # Incremental builds
+    instance.settings.setdefault("RENN_INCREMENTAL", False)
+    instance.settings.setdefault("RENN_INCREMENTAL_PATH", None)
+    instance.settings.setdefault("RENN_AUTORELOAD", False)
 
-def register():
-    # global
-    signals.initialized.connect(set_default_settings)
-    signals.generator_init.connect(register_filters)
+    # Dry run
+    instance.settings.setdefault("RENN_DRY_RUN", None)
 
-    # projects directive
-    signals.generator_init.connect(register_templates)
-    directives.register_directive("projects", ProjectsDirective)
-    directives.register_directive("project", ProjectDirective)
+    # Profiling
+    instance.settings.setdefault("RENN_PROFILE", None)
+    instance.settings.setdefault("RENN_PROFILE_FORMAT", "json")
 
-    # hidden categories
-    signals.article_generator_finalized.connect(create_hidden_categories)
 
-    # noindex categories
-    signals.article_generator_init.connect(patch_generate_direct_templates)
+@profiled
+def init_features(instance):
+    """
+    Signal that imports the features enabled by the settings of a Pelican instance and
+    initializes them.
 
-    # Tailwind CSS
-    signals.initialized.connect(load_tailwind)
-    signals.finalized.connect(compile_css)
+    :param instance: The Pelican instance.
+    """
 
-    # HTML5 RST reader
-    signals.readers_init.connect(patch_reader)
+    for enabled, module_name, init_handlers, _ in _FEATURES:
+        if not enabled(instance.settings):
+            continue
 
-    # Thumbnail
-    signals.initialized.connect(load_pillow)
-    signals.finalized.connect(generate_thumbnails)
+        module = import_module(f".{module_name}", __name__)
+        for handler in init_handlers:
+            getattr(module, handler)(instance)
 
-    # Overrides
-    signals.page_generator_write_page.connect(override_page_context)
-    signals.page_writer_finalized.connect(restore_page_context)
-    signals.article_generator_init.connect(patch_generate_categories)
+
+def _sender_settings(sender):
+    """
+    :param sender: Sender of a signal: a Pelican instance, a generator, the readers, or
+    the list of generators of `all_generators_finalized`.
+    :return: The settings of the site that sent the signal, or `None` if unknown.
+    """
+
+    if isinstance(sender, (list, tuple)):
+        sender = sender[0] if sender else None
+    return getattr(sender, "settings", None)
+
+
+def _feature_handler(enabled, module_name, handler, sender, **kwargs):
+    """
+    Call a handler of a feature if the site that sent the signal enables the feature,
+    importing its module if needed.
+
+    :param enabled: Settings predicate of the feature.
+    :param module_name: Module of the feature.
+    :param handler: Name of the handler.
+    :param sender: Sender of the signal.
+    :param kwargs: Arguments of the signal.
+    :return: The result of the handler, or `None` if the feature is disabled.
+    """
+
+    settings = _sender_settings(sender)
+    if settings is not None and not enabled(settings):
+        return None
+    module = import_module(f".{module_name}", __name__)
+    return getattr(module, handler)(sender, **kwargs)
+
+
+# Connected handlers, created once so that registering the plugin for several Pelican
+# instances doesn't connect them twice
+_HANDLERS = [
+    (sig_name, partial(_feature_handler, enabled, module_name, handler))
+    for enabled, module_name, _, handlers in _FEATURES
+    for sig_name, handler in handlers.items()
+]
+
+
+def register():
+    signals.initialized.connect(set_default_settings)
+    signals.initialized.connect(init_features)
+    # Connecting a handler twice is a no-op; the partials live in `_HANDLERS`
+    for sig_name, handler in _HANDLERS:
+        sig = getattr(signals, sig_name, None) or signal(sig_name)
+        sig.connect(handler)
@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+
+# Key of the build context in the Pelican settings
+SETTINGS_KEY = "_RENN_BUILD_CONTEXT"
+
+_current = ContextVar("renn_build_context", default=None)
+_lock = threading.Lock()
+
+
+def _unpickled_context():
+    """
+    :return: `None`, which stands for the context of settings loaded from a pickle.
+    """
+
+    return None
+
+
+class BuildContext:
+    """
+    State of the plugin for a single Pelican build (a site, or an i18n subsite). The
+    context lives in the settings of the build, so that independent builds can run in
+    parallel threads of the same process without sharing any state.
+    """
+
+    def __init__(self, settings):
+        """
+        :param settings: Pelican settings of the build.
+        """
+
+        self.settings = settings
+        # Context of the main site if this build is an i18n subsite, or self
+        self.main = self
+        self.lock = threading.RLock()
+
+        # Projects directive
+        self.jinja_env = None
+        self.readers = None
+        self.fragments = dict()  # {save_as: content}
+        self.template_digests = dict()
+
+        # reST reader
+        self.prefetched = dict()  # {source_path: Future}
+        self.executor = None
+        self.journals = dict()  # {source_path: directives journal}
+
+        # Thumbnail
+        self.pil = None
+        self.images = dict()  # {image_path: {resize_name, ...}}
+        # Image headers, only set on the context of the main site
+        self.image_metadata = None
+
+        # Tailwind CSS
+        self.tailwindcss = None
+
+        # Overrides
+        self.overrides = dict()  # {(slug, object_type): override}
+        self.override_contexts = dict()  # {(generator, key): layered context}
+        # Overrides of all the sites, and those that matched an object, only filled on
+        # the context of the main site
+        self.override_keys = set()
+        self.matched_overrides = set()
+
+        # Incremental builds
+        self.dependencies = None
+
+        # Profiling, only set on the context of the main site
+        self.profiler = None
+
+        # Dry run, only filled on the context of the main site
+        self.plans = dict()  # {lang: {stage: plan}}
+
+    def __reduce__(self):
+        # The context holds locks and only lives as long as its build: settings pickled
+        # with the content (e.g. by Pelican's content cache, in the URL wrappers) get a
+        # new context when they are used again
+        return _unpickled_context, ()
+
+    @classmethod
+    def of(cls, settings):
+        """
+        Retrieve the build context for some settings, creating it if needed.
+
+        :param settings: Pelican settings of the build.
+        :return: A `BuildContext` instance.
+        """
+
+        # i18n subsites copy the settings of the main site, so we ensure the context
+        # was actually created for these settings; a copied context is the main one
+        context = settings.get(SETTINGS_KEY)
+        if context is None or context.settings is not settings:
+            with _lock:
+                context = settings.get(SETTINGS_KEY)
+                if context is None or context.settings is not settings:
+                    main = context.main if context else None
+                    context = settings[SETTINGS_KEY] = cls(settings)
+                    context.main = main or context
+        return context
+
+    @classmethod
+    def current(cls):
+        """
+        Retrieve the build context activated in the current thread, for code that
+        doesn't have access to the settings (e.g. docutils directives).
+
+        :return: A `BuildContext` instance.
+        :raise RuntimeError: If there is no active build context.
+        """
+
+        context = _current.get()
+        if context is None:
+            raise RuntimeError("No active renn build context")
+        return context
+
+    @contextmanager
+    def activate(self):
+        """
+        Activate the build context in the current thread.
+
+        :return: A context manager that yields the build context.
+        """
+
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
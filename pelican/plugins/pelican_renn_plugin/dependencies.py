@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+
+from .context import BuildContext
+from .profiling import profiled
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump this whenever the format of the graph changes
+GRAPH_VERSION = 1
+
+# Reasons an output is built
+NOT_BUILT = "not built before"
+OUTPUT_MISSING = "output missing"
+OUTPUT_MODIFIED = "output modified since it was built"
+
+
+def _file_digest(path):
+    """
+    :param path: Path of the file.
+    :return: A hexadecimal digest, or `None` if the file can't be read.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+
+
+class DependencyGraph:
+    """
+    Record of the inputs each output of a plugin stage (Tailwind CSS, thumbnails, lazy
+    popover files) was built from, so that a stage only runs again for the outputs
+    whose inputs changed. Inputs are files, identified by their content, and values
+    such as settings, identified by their representation.
+
+    A persistent graph is saved on disk between builds. Otherwise, the graph only lives
+    as long as the Pelican instance, e.g. across the cycles of `--autoreload`.
+
+    Each site of a build (e.g. each i18n subsite) has its own graph, so that subsites
+    built in parallel don't write the same file.
+    """
+
+    def __init__(self, settings, persistent=True):
+        """
+        :param settings: Pelican settings of the site.
+        :param persistent: Whether the graph is saved on disk.
+        """
+
+        self.persistent = persistent
+        # Dry runs don't write anything
+        self.dry_run = bool(settings.get("RENN_DRY_RUN"))
+        self.path = Path(settings["RENN_INCREMENTAL_PATH"]
+                         or Path(settings["CACHE_PATH"])/"renn-dependencies") \
+            / f"{settings["DEFAULT_LANG"]}.json"
+        data = dict()
+        if persistent:
+            try:
+                data = json.loads(self.path.read_text("utf-8"))
+            except (OSError, ValueError):
+                pass
+        if data.get("version") != GRAPH_VERSION:
+            data = dict()
+
+        self.files = data.get("files", dict())  # {path: [mtime_ns, size, digest]}
+        self.outputs = data.get("outputs", dict())  # {stage: {output: record}}
+        # Files and outputs seen during this build, the others are dropped on save
+        self.seen_files = dict()
+        self.seen_outputs = dict()
+        self.report = dict()  # {stage: {"ran": [{output, reason}], "skipped": int}}
+        # Copies of outputs kept by `record`, in memory if the graph isn't persistent
+        self.stash = dict()  # {output: content}
+
+    def file(self, path, fingerprint=None):
+        """
+        Fingerprint a file. A file whose modification time and size are unchanged
+        since the previous build isn't read again.
+
+        :param path: Path of the file.
+        :param fingerprint: Function that computes a custom fingerprint from the path
+        of the file, e.g. to only consider a part of its content. The default is the
+        digest of the whole content.
+        :return: The fingerprint, or `None` if the file doesn't exist.
+        """
+
+        path = str(path)
+        key = f"{path}#{fingerprint.__name__}" if fingerprint else path
+        if key in self.seen_files:
+            return self.seen_files[key][2]
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        mtime_ns, size, digest = self.files.get(key, (None, None, None))
+        if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size) or digest is None:
+            digest = (fingerprint or _file_digest)(path)
+        self.seen_files[key] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    @staticmethod
+    def value(value):
+        """
+        Fingerprint a value, such as a setting.
+
+        :param value: The value; its representation must be stable across builds.
+        :return: A hexadecimal digest.
+        """
+
+        return hashlib.sha256(repr(value).encode()).hexdigest()
+
+    def _stash_path(self, output):
+        """
+        :param output: Path of an output.
+        :return: Path of the copy of the output kept by `record`.
+        """
+
+        digest = hashlib.md5(str(output).encode()).hexdigest()
+        return self.path.parent/"stash"/f"{digest}{Path(output).suffix}"
+
+    def _has_stash(self, output):
+        """
+        :param output: Path of an output.
+        :return: Whether `record` kept a copy of the output.
+        """
+
+        return output in self.stash if not self.persistent \
+            else self._stash_path(output).exists()
+
+    def _restore(self, output):
+        """
+        Restore an output from the copy kept by `record`.
+
+        :param output: Path of the output.
+        :raise OSError: If there is no copy, or it can't be restored.
+        """
+
+        if self.persistent:
+            shutil.copy2(self._stash_path(output), output)
+        elif output not in self.stash:
+            raise FileNotFoundError(output)
+        else:
+            Path(output).write_bytes(self.stash[output])
+
+    def check(self, stage, output, inputs, adopt=False, restore=False):
+        """
+        Check whether an output of a stage must be built again, and add the outcome to
+        the report.
+
+        :param stage: Name of the stage.
+        :param output: Path of the output.
+        :param inputs: `{name: fingerprint}` dictionary of the inputs of the output.
+        :param adopt: Whether an existing output that isn't in the graph is considered
+        up to date, and recorded as built from `inputs`.
+        :param restore: Whether an output that was modified since it was built (e.g.
+        overwritten by a static file) is restored from the copy kept by `record`, if
+        its inputs are unchanged. In dry-run mode, it is considered up to date if the
+        copy exists.
+        :return: The reason the output must be built, or `None` if it is up to date.
+        """
+
+        output = str(output)
+        record = self.outputs.get(stage, dict()).get(output)
+        previous = record["inputs"] if record else dict()
+        if not record:
+            reason = NOT_BUILT
+        elif not os.path.exists(output):
+            reason = OUTPUT_MISSING
+        elif changed := sorted(name for name in inputs.keys() | previous.keys()
+                               if inputs.get(name) != previous.get(name)):
+            reason = "changed: " + ", ".join(changed[:5])
+            if len(changed) > 5:
+                reason += f" and {len(changed) - 5} more"
+        elif self.file(output) != record["digest"]:
+            reason = OUTPUT_MODIFIED
+        else:
+            reason = None
+
+        if reason == NOT_BUILT and adopt and os.path.exists(output):
+            self.record(stage, output, inputs)
+            reason = None
+        elif reason == OUTPUT_MODIFIED and restore and self.dry_run:
+            if self._has_stash(output):
+                reason = None
+        elif reason == OUTPUT_MODIFIED and restore:
+            try:
+                self._restore(output)
+            except OSError:
+                pass
+            else:
+                self.seen_files.pop(output, None)
+                reason = None if self.file(output) == record["digest"] \
+                    else OUTPUT_MODIFIED
+
+        report = self.report.setdefault(stage, {"ran": [], "skipped": 0})
+        if reason:
+            report["ran"].append({"output": output, "reason": reason})
+        else:
+            report["skipped"] += 1
+            # The output is kept as it is
+            self.seen_outputs.setdefault(stage, dict()).setdefault(output, record)
+        return reason
+
+    def record(self, stage, output, inputs, stash=False):
+        """
+        Record the inputs an output was built from.
+
+        :param stage: Name of the stage.
+        :param output: Path of the output.
+        :param inputs: `{name: fingerprint}` dictionary of the inputs of the output.
+        :param stash: Whether to keep a copy of the output, so that it can be
+        restored by `check`. The copy is kept next to the graph if it is persistent,
+        in memory otherwise.
+        """
+
+        output = str(output)
+        # The output was just written, so it is read again
+        self.seen_files.pop(output, None)
+        self.seen_outputs.setdefault(stage, dict())[output] = {
+            "inputs": inputs,
+            "digest": self.file(output),
+        }
+        if stash and not self.persistent:
+            self.stash[output] = Path(output).read_bytes()
+        elif stash:
+            stash_path = self._stash_path(output)
+            stash_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(output, stash_path)
+
+    def save(self):
+        """
+        Write the graph and the report of this build if the graph is persistent, and
+        make this build the reference of the next one.
+        """
+
+        if self.persistent:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            for path, data in ((self.path, {"version": GRAPH_VERSION,
+                                            "files": self.seen_files,
+                                            "outputs": self.seen_outputs}),
+                               (self.path.with_suffix(".report.json"), self.report)):
+                # Write atomically, as a build may be interrupted
+                temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                temp_path.write_text(json.dumps(data, indent=1), "utf-8")
+                temp_path.replace(path)
+
+        self.files, self.outputs = self.seen_files, self.seen_outputs
+        self.seen_files, self.seen_outputs, self.report = dict(), dict(), dict()
+
+
+def dependency_graph(settings):
+    """
+    Retrieve the dependency graph of a site, loading it if needed.
+
+    :param settings: Pelican settings of the site.
+    :return: The `DependencyGraph` of the site, or `None` if neither
+    `RENN_INCREMENTAL` nor `RENN_AUTORELOAD` is enabled.
+    """
+
+    if not (settings.get("RENN_INCREMENTAL") or settings.get("RENN_AUTORELOAD")):
+        return None
+
+    context = BuildContext.of(settings)
+    with context.lock:
+        if context.dependencies is None:
+            context.dependencies = DependencyGraph(
+                settings, persistent=bool(settings["RENN_INCREMENTAL"])
+            )
+    return context.dependencies
+
+
+@profiled
+def save_dependencies(instance):
+    """
+    Once the stages of a site have run, save its dependency graph and log why each
+    stage ran. The graph is kept for the next build of the same Pelican instance.
+
+    :param instance: The Pelican instance.
+    """
+
+    if not (graph := dependency_graph(instance.settings)):
+        return
+
+    # A dry run only planned the outputs, the graph is loaded again by the next build
+    if instance.settings["RENN_DRY_RUN"]:
+        BuildContext.of(instance.settings).dependencies = None
+        return
+
+    for stage, report in graph.report.items():
+        _LOGGER.info(f"renn: {stage}: {len(report["ran"])} output(s) built, "
+                     f"{report["skipped"]} up to date")
+        for entry in report["ran"]:
+            _LOGGER.debug(f"renn: {stage}: {entry["output"]} was built "
+                          f"({entry["reason"]})")
+    graph.save()
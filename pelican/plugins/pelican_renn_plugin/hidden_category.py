@@ -1,3 +1,4 @@
+import heapq
 import logging
 
 from collections import defaultdict
@@ -5,6 +6,8 @@ from operator import attrgetter
 
 from pelican.contents import Category
 
+from .profiling import profiled
+
 _LOGGER = logging.getLogger(__name__)
 
 class HiddenCategory(Category):
@@ -23,8 +26,25 @@ class HiddenCategory(Category):
 
         # The base category is stored here
         self.base_category = base_category
+        # All the articles of the category, ordered like `ArticlesGenerator.dates`
+        self.dates = []
+
+
+def _newest_first(articles, order_by):
+    """
+    Ensure a list of articles is sorted from the newest to the oldest.
+
+    :param articles: List of articles, sorted according to `order_by`.
+    :param order_by: The `ARTICLE_ORDER_BY` setting.
+    :return: The articles, sorted from the newest to the oldest.
+    """
 
+    if order_by == "reversed-date":
+        return articles
+    return sorted(articles, key=attrgetter("date"), reverse=True)
 
+
+@profiled
 def create_hidden_categories(generator):
     """
     Signal that creates our hidden categories.
@@ -36,34 +56,37 @@ def create_hidden_categories(generator):
     if not generator.settings["HIDDENCATEGORY_ENABLE"]:
         return
 
-    extra_categories = defaultdict(list)
+    excludes = set(generator.settings["HIDDENCATEGORY_EXCLUDES"])
+    order_by = generator.settings["ARTICLE_ORDER_BY"]
+
+    hidden_articles = defaultdict(list)
     for article in generator.hidden_articles:
-        category_name = article.category.name if article.category else None
+        category = getattr(article, "category", None)
         # Skip articles without a category, or excluded categories
-        if (not category_name
-            or article.category.slug in generator.settings["HIDDENCATEGORY_EXCLUDES"]):
-            continue
-
-        extra_categories[category_name].append(article)
-
-    # We also add the visible articles
-    for article in generator.articles:
-        category_name = article.category.name if article.category else None
-        # Skip articles without a category
-        if not category_name:
+        if not category or category.slug in excludes:
             continue
 
-        # Categories that don't have hidden articles won't generate a hidden category
-        if category_name in extra_categories:
-            extra_categories[category_name].append(article)
+        hidden_articles[category].append(article)
 
     # We copy the original list because we want it to be distinct from
     # generator.context["categories"], which keeps the new category hidden from the
     # categories template page
+    visible_articles = dict(generator.categories)
     generator.categories = generator.categories.copy()
-    for category_name, articles in extra_categories.items():
-        category = HiddenCategory(articles[0].category)
+    for base_category, hidden in hidden_articles.items():
+        category = HiddenCategory(base_category)
         _LOGGER.info(f"renn: Generating hidden category {category} for "
-                     f"base category {articles[0].category}")
-        articles.sort(key=attrgetter("date"), reverse=True)
+                     f"base category {base_category}")
+
+        # Both lists are already sorted, so we merge them instead of sorting again;
+        # categories that don't have hidden articles won't generate a hidden category
+        visible = visible_articles.get(base_category, [])
+        articles = list(heapq.merge(_newest_first(visible, order_by),
+                                    _newest_first(hidden, order_by),
+                                    key=attrgetter("date"), reverse=True))
+
+        # The dates are paginated along the articles, so they must hold the same
+        # articles
+        category.dates = articles if generator.settings["NEWEST_FIRST_ARCHIVES"] \
+            else articles[::-1]
         generator.categories.append((category, articles))
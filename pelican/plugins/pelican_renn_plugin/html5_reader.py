@@ -1,9 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+import hashlib
+from importlib import metadata
+import inspect
+import json
 import logging
+import multiprocessing
+import os
+from pathlib import Path
+import re
 
+import docutils
+from docutils import nodes
 from docutils.writers.html5_polyglot import HTMLTranslator, Writer
+from pelican.readers import render_node_to_html
+
+from . import projects_directive
+from .context import BuildContext, SETTINGS_KEY
+from .profiling import profiled
 
 _LOGGER = logging.getLogger(__name__)
 
+# Bump this whenever the format of the cache entries changes
+CACHE_VERSION = 2
+
+# Reader used by a process pool worker, which serves a single build
+_worker_reader = None
+
+# Key of the directives journal in the data of Pelican's content cache
+JOURNAL_KEY = "_renn_journal"
+
+# Memory address in the default representation of an object
+_ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+
 
 class PelicanHTML5Translator(HTMLTranslator):
     """
@@ -39,6 +68,381 @@ class PelicanHTML5Writer(Writer):
         self.translator_class = PelicanHTML5Translator
 
 
+def _plugin_version():
+    """
+    Retrieve the installed version of the plugin.
+
+    :return: A version string, or `"unknown"` if the plugin is not installed as a
+    distribution (e.g. when used as a git submodule).
+    """
+
+    try:
+        return metadata.version("pelican-renn-plugin")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _normalize(value):
+    """
+    Convert a settings value to a JSON-serializable structure that doesn't depend on
+    memory addresses or on the iteration order of sets.
+
+    :param value: Any settings value.
+    :return: A JSON-serializable value.
+    """
+
+    match value:
+        case None | bool() | int() | float() | str():
+            return value
+        case dict():
+            return sorted([repr(_normalize(k)), _normalize(v)]
+                          for k, v in value.items())
+        case list() | tuple():
+            return [_normalize(v) for v in value]
+        case set() | frozenset():
+            return sorted(repr(_normalize(v)) for v in value)
+        case _ if isinstance(value, type) or inspect.isroutine(value):
+            # Classes and functions
+            return value.__qualname__
+        case _:
+            # Other objects (e.g. paths, dates or patterns) change the key when their
+            # value changes; default representations hold a memory address
+            return _ADDRESS_RE.sub("", repr(value))
+
+
+def _file_digest(path):
+    """
+    Compute the digest of a file.
+
+    :param path: Path of the file.
+    :return: A hexadecimal digest, or `None` if the file can't be read.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+
+
+class RstCache:
+    """
+    On-disk cache of parsed reST sources. Each entry holds the rendered HTML, the raw
+    metadata and the side effects of the directives for a source file. An entry is
+    valid if the source, the docutils and plugin versions, the settings, the
+    templates used by the directives and the files included by the source are all
+    unchanged.
+    """
+
+    def __init__(self, settings):
+        """
+        :param settings: Pelican settings.
+        """
+
+        self.path = Path(settings["RST_CACHE_PATH"]
+                         or Path(settings["CACHE_PATH"])/"renn-rst")
+        self.base_key = hashlib.sha256(json.dumps([
+            CACHE_VERSION,
+            docutils.__version__,
+            _plugin_version(),
+            _normalize({k: v for k, v in settings.items() if k != SETTINGS_KEY}),
+        ]).encode()).hexdigest()
+
+    def _entry_path(self, source_path):
+        """
+        :param source_path: Path of the source file.
+        :return: Path of the cache entry for the source file.
+        """
+
+        return self.path/f"{hashlib.md5(str(source_path).encode()).hexdigest()}.json"
+
+    def key(self, source_path):
+        """
+        Compute the cache key of a source file.
+
+        :param source_path: Path of the source file.
+        :return: A hexadecimal digest.
+        """
+
+        return hashlib.sha256(
+            f"{self.base_key}:{_file_digest(source_path)}".encode()
+        ).hexdigest()
+
+    def get(self, source_path):
+        """
+        Retrieve the cache entry for a source file.
+
+        :param source_path: Path of the source file.
+        :return: The entry, or `None` if there is no valid entry.
+        """
+
+        try:
+            entry = json.loads(self._entry_path(source_path).read_text("utf-8"))
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("key") != self.key(source_path):
+            return None
+        if entry["templates"] and \
+           entry["templates_digest"] != projects_directive.template_digest(
+               entry["templates"]):
+            return None
+        for dependency, digest in entry["dependencies"].items():
+            if _file_digest(dependency) != digest:
+                return None
+        return entry
+
+    def set(self, source_path, entry):
+        """
+        Store the cache entry for a source file.
+
+        :param source_path: Path of the source file.
+        :param entry: Entry, as returned by `CachedReaderMixin.parse`.
+        """
+
+        entry = entry | {"key": self.key(source_path)}
+        entry_path = self._entry_path(source_path)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write atomically, as several processes may share the cache
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(entry), "utf-8")
+        temp_path.replace(entry_path)
+
+
+class CachedReaderMixin:
+    """
+    Mixin for `pelican.readers.RstReader` that activates the build context while a
+    source is read, and turns a parsed source into a serializable entry, so that it can
+    be stored in a `RstCache` or read ahead of the generators by a process pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = RstCache(self.settings) \
+            if self.settings["RST_CACHE_ENABLE"] else None
+
+    def _parse_raw_metadata(self, document, source_path):
+        """
+        Same as `RstReader._parse_metadata`, but the values are not processed, so that
+        they can be stored in the cache.
+
+        :param document: Parsed docutils document.
+        :param source_path: Path of the source file.
+        :return: A list of `(name, value)` pairs.
+        """
+
+        formatted_fields = self.settings["FORMATTED_FIELDS"]
+
+        if document.first_child_matching_class(nodes.title) is None:
+            _LOGGER.warning(f"Document title missing in file {source_path}: "
+                            f"Ensure exactly one top level section")
+
+        output = []
+        for docinfo in document.findall(nodes.docinfo):
+            for element in docinfo.children:
+                if element.tagname == "field":  # custom fields (e.g. summary)
+                    name_elem, body_elem = element.children
+                    name = name_elem.astext()
+                    if name.lower() in formatted_fields:
+                        value = render_node_to_html(document, body_elem,
+                                                    self.field_body_translator_class)
+                    else:
+                        value = body_elem.astext()
+                elif element.tagname == "authors":  # author list
+                    name = element.tagname
+                    value = [element.astext() for element in element.children]
+                else:  # standard fields (e.g. address)
+                    name = element.tagname
+                    value = element.astext()
+                output.append((name.lower(), value))
+        return output
+
+    def parse(self, source_path):
+        """
+        Parse a source file into a cache entry.
+
+        :param source_path: Path of the source file.
+        :return: A dictionary holding the rendered HTML, the title, the raw metadata,
+        and everything needed to replay the directives and validate the entry.
+        """
+
+        with projects_directive.recording() as journal:
+            pub = self._get_publisher(source_path)
+        parts = pub.writer.parts
+
+        templates = sorted({name for kind, *args in journal if kind == "templates"
+                            for name in args})
+        dependencies = pub.document.settings.record_dependencies.list
+        return {
+            "content": parts.get("body"),
+            "title": parts.get("title"),
+            "metadata": self._parse_raw_metadata(pub.document, source_path),
+            "journal": [entry for entry in journal if entry[0] != "templates"],
+            "templates": templates,
+            "templates_digest": projects_directive.template_digest(templates)
+            if templates else None,
+            "dependencies": {dependency: _file_digest(dependency)
+                             for dependency in dependencies},
+        }
+
+    def load(self, source_path):
+        """
+        Load a source file from the cache, or parse it if needed.
+
+        :param source_path: Path of the source file.
+        :return: A cache entry, as returned by `parse`.
+        """
+
+        if self.cache and (entry := self.cache.get(source_path)) is not None:
+            _LOGGER.debug(f"renn: {source_path} was loaded from the cache")
+            return entry
+
+        entry = self.parse(source_path)
+        if self.cache:
+            self.cache.set(source_path, entry)
+            _LOGGER.debug(f"renn: {source_path} was parsed and cached")
+        return entry
+
+    @profiled(category="reader")
+    def read(self, source_path):
+        """
+        Parse a source file, or retrieve it from the process pool or the cache.
+
+        :param source_path: Path of the source file.
+        :return: A `(content, metadata)` tuple.
+        """
+
+        context = BuildContext.of(self.settings)
+        with context.activate():
+            entry = None
+            if future := context.prefetched.pop(source_path, None):
+                try:
+                    entry = future.result()
+                except Exception:  # noqa: BLE001
+                    # The source is parsed again below, so the error is properly
+                    # reported
+                    _LOGGER.debug(f"renn: Reading {source_path} ahead failed",
+                                  exc_info=True)
+            if entry is None:
+                entry = self.load(source_path)
+
+            projects_directive.replay(entry["journal"])
+            # Kept for Pelican's content cache, which doesn't call the reader again
+            if entry["journal"]:
+                with context.lock:
+                    context.journals[source_path] = entry["journal"]
+
+        metadata = {name: self.process_metadata(name, value)
+                    for name, value in entry["metadata"]}
+        metadata.setdefault("title", entry["title"])
+        return entry["content"], metadata
+
+
+def _init_worker(generator):
+    """
+    Initializer of the process pool workers.
+
+    :param generator: The generator whose reader is used by the worker.
+    """
+
+    global _worker_reader
+
+    # The directives rely on the jinja environment of the build context
+    projects_directive.bind(generator)
+    _worker_reader = generator.readers.readers["rst"]
+
+
+def _load_source(source_path):
+    """
+    Task of the process pool workers.
+
+    :param source_path: Path of the source file.
+    :return: A cache entry.
+    """
+
+    with BuildContext.of(_worker_reader.settings).activate():
+        return _worker_reader.load(source_path)
+
+
+@profiled
+def prefetch_sources(generator):
+    """
+    Signal that reads all the reST articles and pages in a process pool, before the
+    generators start reading them.
+
+    :param generator: An `ArticlesGenerator` instance.
+    """
+
+    workers = generator.settings["RST_READ_WORKERS"]
+    if workers == 1:
+        return
+    reader = generator.readers.readers.get("rst")
+    if not isinstance(reader, CachedReaderMixin):
+        return
+    # Workers inherit the generator (jinja environment, readers, settings), which can't
+    # be pickled
+    if "fork" not in multiprocessing.get_all_start_methods():
+        _LOGGER.warning("renn: 'RST_READ_WORKERS' requires the 'fork' start method, "
+                        "sources will be read sequentially")
+        return
+
+    source_paths = [
+        os.path.abspath(os.path.join(generator.path, f))
+        for paths, excludes in (("ARTICLE_PATHS", "ARTICLE_EXCLUDES"),
+                                ("PAGE_PATHS", "PAGE_EXCLUDES"))
+        for f in generator.get_files(generator.settings[paths],
+                                     exclude=generator.settings[excludes],
+                                     extensions=reader.file_extensions)
+    ]
+    if not source_paths:
+        return
+
+    context = BuildContext.of(generator.settings)
+    context.executor = ProcessPoolExecutor(
+        max_workers=workers or None,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(generator,),
+    )
+    for source_path in source_paths:
+        context.prefetched[source_path] = context.executor.submit(_load_source,
+                                                                  source_path)
+    _LOGGER.info(f"renn: Reading {len(source_paths)} reST source(s) ahead")
+
+
+@profiled
+def finish_prefetch(generators):
+    """
+    Signal that shuts the process pool down once all the sources have been read.
+
+    :param generators: All the generators.
+    """
+
+    if not generators:
+        return
+
+    context = BuildContext.of(generators[0].settings)
+    # Sources that weren't requested (e.g. loaded from Pelican's content cache)
+    context.prefetched.clear()
+    if context.executor:
+        context.executor.shutdown(cancel_futures=True)
+        context.executor = None
+
+
+@cache
+def _cached_reader_class(reader_class):
+    """
+    Create a subclass of a reader class with `CachedReaderMixin`.
+
+    :param reader_class: The reader class.
+    :return: The new class.
+    """
+
+    # The class name is kept, as Pelican uses it for the `reader` metadata
+    return type(reader_class.__name__, (CachedReaderMixin, reader_class), {})
+
+
+@profiled
 def patch_reader(readers):
     """
     Patch the RST reader to parse rst files into HTML5.
@@ -51,8 +455,76 @@ def patch_reader(readers):
         _LOGGER.warning("renn: No 'rst' reader found")
         return
 
-    _LOGGER.debug("renn: Patching rst reader for HTML5 support")
-    # Replace the writer class with our own
-    reader.writer_class = PelicanHTML5Writer
-    # Monkey patch the field body translator base class with the HTML5 version
-    reader.field_body_translator_class.__bases__ = (HTMLTranslator,)
+    if readers.settings["HTML5_ENABLE"]:
+        _LOGGER.debug("renn: Patching rst reader for HTML5 support")
+        # Replace the writer class with our own
+        reader.writer_class = PelicanHTML5Writer
+        # Monkey patch the field body translator base class with the HTML5 version
+        reader.field_body_translator_class.__bases__ = (HTMLTranslator,)
+
+    # Wrap the reader so that the directives have access to the build context
+    readers.reader_classes["rst"] = _cached_reader_class(reader)
+
+
+def _attach_journal(context, filename, data):
+    """
+    :param context: `BuildContext` of the site.
+    :param filename: Path of the source file.
+    :param data: Data cached by Pelican: a `(content, metadata)` tuple for the readers,
+    or a content object for the generators.
+    :return: The data, holding the directives journal of the source file, if any.
+    """
+
+    if isinstance(data, tuple):
+        content, metadata = data
+        journal = context.journals.get(os.path.abspath(filename))
+        return (content, metadata | {JOURNAL_KEY: journal}) if journal else data
+    if journal := context.journals.get(getattr(data, "source_path", None)):
+        setattr(data, JOURNAL_KEY, journal)
+    return data
+
+
+def _detach_journal(data):
+    """
+    :param data: Data cached by Pelican, see `_attach_journal`.
+    :return: A `(data, journal)` tuple, with `data` without the journal, and `journal`
+    the directives journal of the source file, or `None`.
+    """
+
+    if isinstance(data, tuple):
+        content, metadata = data
+        if not metadata or JOURNAL_KEY not in metadata:
+            return data, None
+        metadata = dict(metadata)
+        return (content, metadata), metadata.pop(JOURNAL_KEY)
+    return data, getattr(data, JOURNAL_KEY, None)
+
+
+@profiled
+def patch_content_cache(cacher):
+    """
+    Make Pelican's content cache keep the side effects of the directives (lazy popover
+    contents and registered images) of each source file, and replay them when a source
+    is loaded from the cache, as the reader isn't called then.
+
+    :param cacher: `Readers` instance, or generator, whose content cache is patched.
+    """
+
+    if not hasattr(cacher, "get_cached_data"):
+        return
+
+    context = BuildContext.of(cacher.settings)
+    cache_data, get_cached_data = cacher.cache_data, cacher.get_cached_data
+
+    def cache_data_with_journal(filename, data):
+        cache_data(filename, _attach_journal(context, filename, data))
+
+    def get_cached_data_with_journal(filename, default=None):
+        data, journal = _detach_journal(get_cached_data(filename, default))
+        if journal:
+            with context.activate():
+                projects_directive.replay(journal)
+        return data
+
+    cacher.cache_data = cache_data_with_journal
+    cacher.get_cached_data = get_cached_data_with_journal
@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import os
+import threading
+
+from .context import BuildContext
+
+_LOGGER = logging.getLogger(__name__)
+
+# EXIF tag of the orientation of an image
+ORIENTATION_TAG = 0x0112
+# EXIF orientations of the images whose width and height are swapped when displayed
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class ImageInfo:
+    """
+    Facts about an image read from its header, without decoding it: its size, mode,
+    format and EXIF orientation, or the error that prevented reading them. The
+    modification time and size of the file tell whether the facts are still valid.
+    """
+
+    __slots__ = ("error", "file_size", "format", "height", "mode", "mtime_ns",
+                 "orientation", "width")
+
+    def __init__(self, stat, width=None, height=None, mode=None, image_format=None,
+                 orientation=None, error=None):
+        """
+        :param stat: `os.stat_result` of the file.
+        :param width: Width of the image.
+        :param height: Height of the image.
+        :param mode: Pillow mode of the image, e.g. `RGB`.
+        :param image_format: Pillow format of the image, e.g. `JPEG`.
+        :param orientation: EXIF orientation of the image, or `None` if it isn't set.
+        :param error: Why the header couldn't be read, or `None`.
+        """
+
+        self.mtime_ns = stat.st_mtime_ns
+        self.file_size = stat.st_size
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.format = image_format
+        self.orientation = orientation
+        self.error = error
+
+    @property
+    def size(self):
+        """
+        :return: A `(width, height)` tuple, or `None` if the header couldn't be read.
+        """
+
+        return None if self.error else (self.width, self.height)
+
+    @property
+    def display_size(self):
+        """
+        :return: A `(width, height)` tuple of the image as displayed, i.e. once its EXIF
+        orientation is applied, or `None` if the header couldn't be read.
+        """
+
+        if self.error:
+            return None
+        if self.orientation in TRANSPOSED_ORIENTATIONS:
+            return self.height, self.width
+        return self.width, self.height
+
+    @property
+    def pixels(self):
+        """
+        :return: The number of pixels, or `None` if the header couldn't be read.
+        """
+
+        return None if self.error else self.width * self.height
+
+
+def _read_header(path, stat, pil):
+    """
+    :param path: Path of the image.
+    :param stat: `os.stat_result` of the file.
+    :param pil: The Pillow imports, as loaded by `load_pillow`.
+    :return: The `ImageInfo` of the image.
+    """
+
+    try:
+        with pil.Image.open(path) as image:
+            # JPEG images hold their EXIF data in their header, but other formats may
+            # hold it after the pixels, which aren't read
+            orientation = image.getexif().get(ORIENTATION_TAG) \
+                if "exif" in image.info else None
+            return ImageInfo(stat, image.width, image.height, image.mode, image.format,
+                             orientation)
+    except OSError as e:
+        return ImageInfo(stat, error=str(e) or "couldn't be opened")
+    except pil.Image.DecompressionBombError as e:
+        return ImageInfo(stat, error=str(e))
+
+
+class ImageMetadata:
+    """
+    Table of the `ImageInfo` of the images of a build, shared by the main site and its
+    i18n subsites, and kept across the builds of the same Pelican instance. An image is
+    read again when the modification time or size of its file change.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.infos = dict()  # {path: ImageInfo}
+
+    def scan(self, paths, pil):
+        """
+        Read the headers of images in a thread pool, unless they are in the table.
+
+        :param paths: Paths of the images.
+        :param pil: The Pillow imports, as loaded by `load_pillow`.
+        :return: A `{path: info}` dictionary, where `info` is the `ImageInfo` of the
+        image, or `None` if the file doesn't exist or Pillow isn't loaded.
+        """
+
+        results = dict()
+        misses = []  # [(path, stat)]
+        for path in paths:
+            results[path] = None
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            info = self.infos.get(str(path))
+            if info and (info.mtime_ns, info.file_size) == (stat.st_mtime_ns,
+                                                            stat.st_size):
+                results[path] = info
+            elif pil:
+                misses.append((path, stat))
+
+        if len(misses) > 1:
+            with ThreadPoolExecutor() as executor:
+                infos = list(executor.map(partial(_read_header, pil=pil),
+                                          *zip(*misses, strict=True)))
+        else:
+            infos = [_read_header(*miss, pil) for miss in misses]
+
+        with self.lock:
+            for (path, _), info in zip(misses, infos, strict=True):
+                self.infos[str(path)] = results[path] = info
+        if misses:
+            _LOGGER.debug(f"renn: Read the headers of {len(misses)} image(s), "
+                          f"{len(results) - len(misses)} were known")
+        return results
+
+    def get(self, path, pil):
+        """
+        :param path: Path of an image.
+        :param pil: The Pillow imports, as loaded by `load_pillow`.
+        :return: The `ImageInfo` of the image, or `None` (see `scan`).
+        """
+
+        return self.scan([path], pil)[path]
+
+
+def image_metadata(settings):
+    """
+    Retrieve the image metadata table of a build, creating it if needed.
+
+    :param settings: Pelican settings.
+    :return: The `ImageMetadata` shared by the main site and its subsites.
+    """
+
+    context = BuildContext.of(settings).main
+    with context.lock:
+        if context.image_metadata is None:
+            context.image_metadata = ImageMetadata()
+    return context.image_metadata
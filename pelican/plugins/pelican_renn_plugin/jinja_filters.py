@@ -1,10 +1,19 @@
+from functools import lru_cache
 import re
 
 from jinja2 import pass_context
 
 from .thumbnail import path_to_dict, ResizeSpec
+from .profiling import profiled
 
+# Filters are called in loops of the templates and the directives, with few distinct
+# arguments, so their results are cached
+FILTER_CACHE_SIZE = 4096
 
+LINK_PATTERN = re.compile(r"^(.*)\s*<([^>]+)>$")
+
+
+@profiled
 def register_filters(generator):
     """
     Signal that registers the custom jinja filters.
@@ -15,6 +24,8 @@ def register_filters(generator):
     generator.env.filters["get_thumbnail"] = get_thumbnail
 
 
+# Typed, so that a `Markup` link doesn't get the result of an equal `str`
+@lru_cache(maxsize=FILTER_CACHE_SIZE, typed=True)
 def parse_link(raw):
     """
     Parse a raw link (`text <uri>` or `uri`).
@@ -23,7 +34,7 @@ def parse_link(raw):
     :return: A `(title, uri)` tuple.
     """
 
-    match = re.match(r"^(.*)\s*<([^>]+)>$", raw)
+    match = LINK_PATTERN.match(raw)
     if not match:
         return raw, ""
     uri = match[2]
@@ -31,6 +42,7 @@ def parse_link(raw):
     return title.strip(), uri.strip()
 
 
+@lru_cache(maxsize=256)
 def get_flag_emoji(code):
     """
     Retrieve a flag emoji from a country code.
@@ -43,7 +55,7 @@ def get_flag_emoji(code):
     if code == "en":
         code = "gb"
 
-    return "".join([chr(127397 + ord(c)) for c in list(code.upper())])
+    return "".join(chr(127397 + ord(c)) for c in code.upper())
 
 
 @pass_context
@@ -64,7 +76,24 @@ def get_thumbnail(ctx, path, resize):
     if not resize_spec:
         return path
 
-    return ctx["THUMBNAIL_SAVE_AS"].format(
+    try:
+        return _thumbnail_path(ctx["THUMBNAIL_SAVE_AS"], path, resize, resize_spec)
+    except TypeError:  # Unhashable spec, e.g. a list from a JSON setting
+        return _thumbnail_path.__wrapped__(ctx["THUMBNAIL_SAVE_AS"], path, resize,
+                                           resize_spec)
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _thumbnail_path(save_as, path, resize, resize_spec):
+    """
+    :param save_as: The THUMBNAIL_SAVE_AS format string.
+    :param path: Path of the image.
+    :param resize: Name of the resize spec.
+    :param resize_spec: Resize spec, as set in `THUMBNAIL_RESIZES`.
+    :return: The thumbnail path.
+    """
+
+    return save_as.format(
         resize=resize,
         resize_spec=str(ResizeSpec(resize_spec)),
         **path_to_dict(path)
@@ -1,49 +1,64 @@
 from functools import wraps
 import os
 
+from .overrides import DirectTemplate, DirectTemplateOverride, override_context
+from .profiling import profiled
+from .writer import write_files
 
+
+@profiled
 def patch_generate_direct_templates(generator):
     """
     Monkey-patch `ArticlesGenerator.generate_direct_templates` to intercept the index
-    generation and remove articles in no-index categories.
+    generation and remove articles in no-index categories. Direct templates are also
+    written with their own context, so that they can be overridden, and possibly in
+    parallel.
     """
 
-    if not generator.settings["NOINDEX_CATEGORIES"]:
-        return
-
+    @profiled(settings=generator.settings)
     @wraps(generator.generate_direct_templates)
     def patched_generate_direct_templates(write):
-        for template in generator.settings["DIRECT_TEMPLATES"]:
-            save_as = generator.settings.get(
-                f"{template.upper()}_SAVE_AS", f"{template}.html"
-            )
-            url = generator.settings.get(f"{template.upper()}_URL", f"{template}.html")
-            if not save_as:
-                continue
-
-            match template:
-                case "index":
-                    def _process(l):
-                        return [a for a in l
-                                if a.category.slug
-                                   not in generator.settings["NOINDEX_CATEGORIES"]]
-
-                    articles = _process(generator.articles)
-                    dates = _process(generator.dates)
-                case _:
-                    articles = generator.articles
-                    dates = generator.dates
-
-            write(
-                save_as,
-                generator.get_template(template),
-                generator.context,
-                articles=articles,
-                dates=dates,
-                blog=True,
-                template_name=template,
-                page_name=os.path.splitext(save_as)[0],
-                url=url,
+        # The filtered views are computed once; the articles and the dates hold the
+        # same articles, so that they can be paginated together
+        noindex = frozenset(generator.settings["NOINDEX_CATEGORIES"])
+        if noindex:
+            index_articles, index_dates = (
+                [a for a in articles if a.category.slug not in noindex]
+                for articles in (generator.articles, generator.dates)
             )
+        else:
+            index_articles, index_dates = generator.articles, generator.dates
+
+        def jobs():
+            for template in generator.settings["DIRECT_TEMPLATES"]:
+                save_as = generator.settings.get(
+                    f"{template.upper()}_SAVE_AS", f"{template}.html"
+                )
+                url = generator.settings.get(f"{template.upper()}_URL",
+                                             f"{template}.html")
+                if not save_as:
+                    continue
+
+                match template:
+                    case "index":
+                        articles, dates = index_articles, index_dates
+                    case _:
+                        articles, dates = generator.articles, generator.dates
+
+                context = override_context(DirectTemplateOverride,
+                                           DirectTemplate(template), generator)
+                yield (
+                    (save_as, generator.get_template(template), context),
+                    dict(
+                        articles=articles,
+                        dates=dates,
+                        blog=True,
+                        template_name=template,
+                        page_name=os.path.splitext(save_as)[0],
+                        url=url,
+                    ),
+                )
+
+        write_files(generator.settings, write, jobs())
 
     generator.generate_direct_templates = patched_generate_direct_templates
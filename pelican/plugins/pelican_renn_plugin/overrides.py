@@ -1,11 +1,18 @@
 import logging
-from functools import wraps
+from collections import ChainMap, defaultdict, namedtuple
+from collections.abc import Mapping
+from functools import partial, wraps
+from itertools import chain
 
-from pelican.generators import Generator
-from pelican.contents import Page
-from pelican.urlwrappers import Category
+from pelican import signals
+from pelican.generators import ArticlesGenerator, Generator, PagesGenerator
+from pelican.contents import Article, Page
+from pelican.urlwrappers import Author, Category, Tag
 
+from .context import BuildContext
 from .hidden_category import HiddenCategory
+from .profiling import profiled
+from .writer import write_files
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -44,11 +51,6 @@ class BaseOverride:
         self.object = obj
         self.generator = generator
 
-        # If this is the first time this generator is overridden, backup the original
-        # context in the generator itself
-        if not hasattr(self.generator, "orig_context"):
-            generator.orig_context = generator.context
-
     @property
     def override_key(self):
         """
@@ -61,33 +63,29 @@ class BaseOverride:
 
     def __call__(self):
         """
-        Apply the override to the generator.
-
-        :return: `True` if there was an override for the object, `False` otherwise.
-        """
-
-        # Set the context for this page to a copy of the original context
-        self.generator.context = self.generator.orig_context.copy()
-
-        # If we have an override for this page, update the temporary context
-        override_context = self.generator.settings["OVERRIDES"].get(self.override_key)
-        if override_context:
-            self.generator.context.update(override_context)
-            return True
-        return False
-
-    @classmethod
-    def restore_context(cls, generator):
-        """
-        Restore the original context in the generator and delete the temporary
-        attribute.
+        Build the context to write the object with. The generator context itself is
+        never modified, so that objects can be written concurrently.
 
-        :param generator: A `pelican.generators.Generator` instance.
+        :return: The generator context, with the override layered over it if there is
+        one for the object.
         """
 
-        if hasattr(generator, "orig_context"):
-            generator.context = generator.orig_context
-            delattr(generator, "orig_context")
+        context = BuildContext.of(self.generator.settings)
+        key = self.override_key
+        # Without an override, the generator context is used as is
+        if key not in context.overrides:
+            return self.generator.context
+
+        # The layered context is built once per generator and reused; its empty first
+        # layer receives any write, so that neither the generator context nor the
+        # override are modified
+        cache_key = (self.generator, key)
+        if (layered := context.override_contexts.get(cache_key)) is None:
+            layered = context.override_contexts.setdefault(
+                cache_key,
+                ChainMap({}, context.overrides[key], self.generator.context)
+            )
+        return layered
 
     @classmethod
     def subclass(cls, obj_type, name=None):
@@ -106,8 +104,15 @@ class BaseOverride:
         return type(name, (cls,), {"object_type": obj_type})
 
 
+# A direct template (e.g. `index`), identified by its name
+DirectTemplate = namedtuple("DirectTemplate", ["slug"])
+
 PageOverride = BaseOverride.subclass(Page)
+ArticleOverride = BaseOverride.subclass(Article)
 CategoryOverride = BaseOverride.subclass(Category)
+TagOverride = BaseOverride.subclass(Tag)
+AuthorOverride = BaseOverride.subclass(Author)
+DirectTemplateOverride = BaseOverride.subclass(DirectTemplate)
 
 
 class HiddenCategoryOverride(BaseOverride):
@@ -123,66 +128,324 @@ class HiddenCategoryOverride(BaseOverride):
         return self.object.base_category.slug, self.object_type.__name__
 
 
-def override_page_context(generator, content):
+# Supported overrides, by object type name
+OVERRIDE_CLASSES = {
+    override_cls.object_type.__name__: override_cls
+    for override_cls in (PageOverride, ArticleOverride, CategoryOverride,
+                         HiddenCategoryOverride, TagOverride, AuthorOverride,
+                         DirectTemplateOverride)
+}
+
+
+@profiled
+def compile_overrides(instance):
+    """
+    Signal that validates `OVERRIDES` and compiles it into the index used by the
+    overrides, so that invalid entries are reported instead of silently ignored.
+
+    :param instance: The Pelican instance.
+    """
+
+    context = BuildContext.of(instance.settings)
+    context.overrides = dict()
+    context.override_contexts = dict()
+    for key, override in instance.settings["OVERRIDES"].items():
+        match key:
+            case (str(), str(type_name)) if type_name in OVERRIDE_CLASSES:
+                pass
+            case (str(), str(type_name)):
+                _LOGGER.warning(f"renn: Override {key!r} has an unknown object type "
+                                f"'{type_name}', expected one of "
+                                f"{", ".join(OVERRIDE_CLASSES)}")
+                continue
+            case _:
+                _LOGGER.warning(f"renn: Override {key!r} should be a "
+                                f"(slug, object_type) tuple")
+                continue
+        if not isinstance(override, Mapping):
+            _LOGGER.warning(f"renn: Override {key!r} should be a mapping of settings")
+            continue
+        if override:
+            context.overrides[key] = override
+
+
+def _overridable_objects(generator):
+    """
+    Enumerate the objects written by a generator that can be overridden.
+
+    :param generator: A `pelican.generators.Generator` instance.
+    :return: A generator of `(override_cls, obj)` tuples.
     """
-    Signal that overrides the context for the page if required.
 
-    :param generator: A `PagesGenerator` instance.
-    :param content: A `Page` object.
+    if isinstance(generator, PagesGenerator):
+        for page in chain(generator.translations, generator.pages,
+                          generator.hidden_translations, generator.hidden_pages,
+                          generator.draft_translations, generator.draft_pages):
+            yield PageOverride, page
+    elif isinstance(generator, ArticlesGenerator):
+        for article in chain(generator.translations, generator.articles,
+                             generator.hidden_translations, generator.hidden_articles):
+            yield ArticleOverride, article
+        for cat, _ in generator.categories:
+            yield (HiddenCategoryOverride if isinstance(cat, HiddenCategory)
+                   else CategoryOverride), cat
+        for tag in generator.tags:
+            yield TagOverride, tag
+        for author, _ in generator.authors:
+            yield AuthorOverride, author
+        for template in generator.settings["DIRECT_TEMPLATES"]:
+            yield DirectTemplateOverride, DirectTemplate(template)
+
+
+@profiled
+def check_overrides(generators):
     """
+    Signal that records which overrides of a site match an object, so that the
+    overrides that don't match any object of any site are reported once the build is
+    done (see `report_unused_overrides`).
+
+    :param generators: All the generators of the site.
+    """
+
+    if not generators:
+        return
+
+    context = BuildContext.of(generators[0].settings)
+    matched = set()
+    for generator in generators:
+        for override_cls, obj in _overridable_objects(generator):
+            matched.add(override_cls(obj, generator).override_key)
 
-    if PageOverride(content, generator)():
-        _LOGGER.info(f"renn: An override was found and applied for page {content.slug}")
+    with context.main.lock:
+        context.main.override_keys.update(context.overrides)
+        context.main.matched_overrides.update(matched & context.overrides.keys())
 
 
-def restore_page_context(generator, writer):
+def collect_override_matches(pelican_obj):
     """
-    When all pages are written, this signal restores the original context.
+    Signal sent in the worker process of an i18n subsite built in parallel, which hands
+    the overrides of the subsite and those that matched back to the main process.
 
-    :param generator: A `PagesGenerator` instance.
-    :param writer: A `Writer` object.
+    :param pelican_obj: The Pelican instance of the subsite.
+    :return: A callable that merges them in the main process.
     """
 
-    PageOverride.restore_context(generator)
-    _LOGGER.debug(f"renn: Restored the context for {generator}")
+    main = BuildContext.of(pelican_obj.settings).main
+    with main.lock:
+        keys, matched = main.override_keys, main.matched_overrides
+    return partial(_merge_override_matches, keys, matched) if keys else None
 
 
-def patch_generate_categories(generator):
+def _merge_override_matches(keys, matched, pelican_obj):
     """
-    Monkey-patch `ArticlesGenerator.generate_categories` to intercept the category
-    generation and apply overrides.
+    :param keys: Overrides of a subsite built in a worker process.
+    :param matched: Overrides that matched an object of the subsite.
+    :param pelican_obj: The main Pelican instance.
     """
 
-    if not generator.settings["OVERRIDES"]:
+    context = BuildContext.of(pelican_obj.settings)
+    with context.lock:
+        context.override_keys.update(keys)
+        context.matched_overrides.update(matched)
+
+
+def report_unused_overrides(instance):
+    """
+    Once the main site and its subsites are built, warn about the overrides that don't
+    match any object of any site, as an override may target a single subsite.
+
+    :param instance: The Pelican instance.
+    """
+
+    context = BuildContext.of(instance.settings)
+    if context.main is not context:
         return
 
-    @wraps(generator.generate_categories)
-    def patched_generate_categories(write):
-        category_template = generator.get_template("category")
-        for cat, articles in generator.categories:
-            override_cls = HiddenCategoryOverride if isinstance(cat, HiddenCategory) \
-                else CategoryOverride
-
-            if override_cls(cat, generator)():
-                _LOGGER.info(f"renn: An override was found and applied "
-                             f"for category {cat.slug}")
-
-            dates = [article for article in generator.dates if article in articles]
-            write(
-                cat.save_as,
-                category_template,
-                generator.context,
-                url=cat.url,
-                category=cat,
-                articles=articles,
-                dates=dates,
-                template_name="category",
-                blog=True,
-                page_name=cat.page_name,
-                all_articles=generator.articles,
-            )
+    with context.lock:
+        unused = context.override_keys - context.matched_overrides
+        context.override_keys, context.matched_overrides = set(), set()
+    for key in sorted(unused, key=repr):
+        _LOGGER.warning(f"renn: Override {key!r} doesn't match any object")
+
+
+def override_context(override_cls, obj, generator):
+    """
+    Build the context to write an object with, and log if an override was applied.
 
-        BaseOverride.restore_context(generator)
-        _LOGGER.debug(f"renn: Restored the context for {generator}")
+    :param override_cls: A `BaseOverride` subclass.
+    :param obj: Object that's being written.
+    :param generator: A `pelican.generators.Generator` instance.
+    :return: The context for the object.
+    """
+
+    context = override_cls(obj, generator)()
+    if context is not generator.context:
+        _LOGGER.info(f"renn: An override was found and applied for "
+                     f"{override_cls.object_type.__name__.lower()} {obj.slug}")
+    return context
 
+
+@profiled
+def patch_pages_generator(generator):
+    """
+    Monkey-patch `PagesGenerator.generate_output` to write every page with its own
+    context, possibly in parallel.
+    """
+
+    @profiled(settings=generator.settings)
+    @wraps(generator.generate_output)
+    def patched_generate_output(writer):
+        def jobs():
+            for page in chain(
+                generator.translations,
+                generator.pages,
+                generator.hidden_translations,
+                generator.hidden_pages,
+                generator.draft_translations,
+                generator.draft_pages,
+            ):
+                signals.page_generator_write_page.send(generator, content=page)
+                yield (
+                    (
+                        page.save_as,
+                        generator.get_template(page.template),
+                        override_context(PageOverride, page, generator),
+                    ),
+                    dict(
+                        page=page,
+                        relative_urls=generator.settings["RELATIVE_URLS"],
+                        override_output=hasattr(page, "override_save_as"),
+                        url=page.url,
+                    ),
+                )
+
+        write_files(generator.settings, writer.write_file, jobs())
+        signals.page_writer_finalized.send(generator, writer=writer)
+
+    generator.generate_output = patched_generate_output
+
+
+def index_dates(generator, attribute):
+    """
+    Group the date-ordered articles of a generator by category, tag or author, in a
+    single pass.
+
+    :param generator: An `ArticlesGenerator` instance.
+    :param attribute: Article attribute to group by: `category`, `tags` or `authors`.
+    :return: A `{group: [article, ...]}` dictionary, where the articles keep the order
+    of `generator.dates`.
+    """
+
+    dates = defaultdict(list)
+    for article in generator.dates:
+        groups = getattr(article, attribute, None) or ()
+        for group in groups if isinstance(groups, list) else (groups,):
+            dates[group].append(article)
+    return dates
+
+
+def _listing_jobs(generator, name, attribute, listing, override_cls):
+    """
+    Build the write jobs of a listing of articles, such as the category pages.
+
+    :param generator: An `ArticlesGenerator` instance.
+    :param name: Name of the listing: `category`, `tag` or `author`. It is used as the
+    template name, and as the name of the listed object in the template context.
+    :param attribute: Article attribute the listing is grouped by.
+    :param listing: Iterable of `(object, articles)` tuples.
+    :param override_cls: `BaseOverride` subclass of the listed objects. Hidden
+    categories always use `HiddenCategoryOverride`.
+    :return: A generator of `(args, kwargs)` tuples for `write_files`.
+    """
+
+    template = generator.get_template(name)
+    dates_index = index_dates(generator, attribute)
+    for obj, articles in listing:
+        is_hidden = isinstance(obj, HiddenCategory)
+
+        # generator.dates only holds visible articles, so hidden categories keep their
+        # own dates
+        dates = obj.dates if is_hidden else dates_index.get(obj, [])
+        yield (
+            (
+                obj.save_as,
+                template,
+                override_context(HiddenCategoryOverride if is_hidden
+                                 else override_cls, obj, generator),
+            ),
+            {
+                "url": obj.url,
+                name: obj,
+                "articles": articles,
+                "dates": dates,
+                "template_name": name,
+                "blog": True,
+                "page_name": obj.page_name,
+                "all_articles": generator.articles,
+            },
+        )
+
+
+@profiled
+def patch_articles_generator(generator):
+    """
+    Monkey-patch the `ArticlesGenerator` methods that write articles, categories, tags
+    and authors, to write every object with its own context, possibly in parallel. The
+    date-ordered articles of every category, tag and author are also indexed once,
+    instead of filtering `generator.dates` for each of them.
+    """
+
+    @profiled(settings=generator.settings)
+    @wraps(generator.generate_articles)
+    def patched_generate_articles(write):
+        def jobs():
+            for article in chain(
+                generator.translations,
+                generator.articles,
+                generator.hidden_translations,
+                generator.hidden_articles,
+            ):
+                signals.article_generator_write_article.send(generator,
+                                                             content=article)
+                yield (
+                    (
+                        article.save_as,
+                        generator.get_template(article.template),
+                        override_context(ArticleOverride, article, generator),
+                    ),
+                    dict(
+                        article=article,
+                        category=getattr(article, "category", None),
+                        override_output=hasattr(article, "override_save_as"),
+                        url=article.url,
+                        blog=True,
+                    ),
+                )
+
+        write_files(generator.settings, write, jobs())
+
+    @profiled(settings=generator.settings)
+    @wraps(generator.generate_categories)
+    def patched_generate_categories(write):
+        write_files(generator.settings, write,
+                    _listing_jobs(generator, "category", "category",
+                                  generator.categories, CategoryOverride))
+
+    @profiled(settings=generator.settings)
+    @wraps(generator.generate_tags)
+    def patched_generate_tags(write):
+        write_files(generator.settings, write,
+                    _listing_jobs(generator, "tag", "tags", generator.tags.items(),
+                                  TagOverride))
+
+    @profiled(settings=generator.settings)
+    @wraps(generator.generate_authors)
+    def patched_generate_authors(write):
+        write_files(generator.settings, write,
+                    _listing_jobs(generator, "author", "authors", generator.authors,
+                                  AuthorOverride))
+
+    generator.generate_articles = patched_generate_articles
     generator.generate_categories = patched_generate_categories
+    generator.generate_tags = patched_generate_tags
+    generator.generate_authors = patched_generate_authors
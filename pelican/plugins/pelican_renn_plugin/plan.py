@@ -0,0 +1,141 @@
+from functools import partial
+import json
+import logging
+import os
+from pathlib import Path
+
+from .context import BuildContext
+
+_LOGGER = logging.getLogger(__name__)
+
+# Numeric fields of the jobs, summed in the totals
+_SUMMED_FIELDS = ("pixels", "output_pixels", "input_bytes", "memory_bytes")
+
+
+def stage_plan(settings, stage):
+    """
+    Retrieve the plan of a post-processing stage of a site in dry-run mode, creating it
+    if needed. Stages that plan their outputs don't write anything.
+
+    :param settings: Pelican settings of the site.
+    :param stage: Name of the stage.
+    :return: A `{"jobs", "up_to_date", "refused", "orphaned"}` dictionary of lists,
+    or `None` if `RENN_DRY_RUN` is not set.
+    """
+
+    if not settings.get("RENN_DRY_RUN"):
+        return None
+
+    main = BuildContext.of(settings).main
+    with main.lock:
+        plan = main.plans.setdefault(settings["DEFAULT_LANG"], dict())
+        return plan.setdefault(stage, {"jobs": [], "up_to_date": [], "refused": [],
+                                       "orphaned": []})
+
+
+def orphaned_outputs(graph, stage, planned, directories=()):
+    """
+    Find the existing outputs of a stage that it wouldn't build anymore.
+
+    :param graph: `DependencyGraph` of the site, or `None`.
+    :param stage: Name of the stage.
+    :param planned: Paths of the outputs the stage would build or keep.
+    :param directories: Directories that only hold outputs of the stage.
+    :return: A sorted list of paths.
+    """
+
+    orphans = set()
+    if graph:
+        orphans.update(output for output in graph.outputs.get(stage, dict())
+                       if os.path.exists(output))
+    for directory in directories:
+        if os.path.isdir(directory):
+            orphans.update(str(path) for path in Path(directory).iterdir()
+                           if path.is_file())
+    return sorted(orphans - {str(path) for path in planned})
+
+
+def _totals(plans):
+    """
+    :param plans: `{stage: plan}` dictionaries to add up.
+    :return: The totals of the plans, by stage.
+    """
+
+    totals = dict()
+    for plan in plans:
+        for stage, entries in plan.items():
+            total = totals.setdefault(stage, {
+                "jobs": 0, "create": 0, "replace": 0, "up_to_date": 0, "refused": 0,
+                "orphaned": 0, "cache_hits": 0, "cache_misses": 0,
+                **{field: 0 for field in _SUMMED_FIELDS},
+            })
+            total["jobs"] += len(entries["jobs"])
+            for job in entries["jobs"]:
+                total[job["action"]] += 1
+                if cache := job.get("cache"):
+                    total["cache_hits" if cache == "hit" else "cache_misses"] += 1
+                for field in _SUMMED_FIELDS:
+                    total[field] += job.get(field) or 0
+            for key in ("up_to_date", "refused", "orphaned"):
+                total[key] += len(entries[key])
+    return totals
+
+
+def write_plan(instance):
+    """
+    Once the main site and its subsites are planned, write the dry-run report.
+
+    :param instance: The Pelican instance.
+    """
+
+    context = BuildContext.of(instance.settings)
+    if context.main is not context or not instance.settings["RENN_DRY_RUN"]:
+        return
+
+    with context.lock:
+        plans, context.plans = context.plans, dict()
+    report = {
+        "totals": _totals(plans.values()),
+        "sites": {lang: {"totals": _totals([plan]), **plan}
+                  for lang, plan in plans.items()},
+    }
+
+    path = Path(instance.settings["RENN_DRY_RUN"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    for stage, total in report["totals"].items():
+        _LOGGER.info(f"renn: Dry run: {stage}: {total["create"]} to create, "
+                     f"{total["replace"]} to replace, {total["up_to_date"]} up to "
+                     f"date, {total["refused"]} refused, {total["orphaned"]} orphaned")
+    _LOGGER.info(f"renn: Dry-run plan written to {path}")
+
+
+def collect_plan(pelican_obj):
+    """
+    Signal sent in the worker process of an i18n subsite built in parallel, which hands
+    the plan of the subsite back to the main process.
+
+    :param pelican_obj: The Pelican instance of the subsite.
+    :return: A callable that merges the plan in the main process.
+    """
+
+    if not pelican_obj.settings["RENN_DRY_RUN"]:
+        return None
+
+    lang = pelican_obj.settings["DEFAULT_LANG"]
+    main = BuildContext.of(pelican_obj.settings).main
+    with main.lock:
+        plan = main.plans.get(lang)
+    return partial(_merge_plan, lang, plan) if plan else None
+
+
+def _merge_plan(lang, plan, pelican_obj):
+    """
+    :param lang: Language of the subsite.
+    :param plan: Plan of the subsite.
+    :param pelican_obj: The main Pelican instance.
+    """
+
+    context = BuildContext.of(pelican_obj.settings)
+    with context.lock:
+        context.plans[lang] = plan
@@ -0,0 +1,163 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from graphlib import CycleError, TopologicalSorter
+import inspect
+import logging
+import time
+
+from .profiling import profiled
+
+_LOGGER = logging.getLogger(__name__)
+
+# Post-processing stages, by name: {name: (function, names of the stages it runs after)}
+_STAGES = dict()
+
+# Outcomes of a stage
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def post_processing_stage(name, after=()):
+    """
+    Decorator that registers a post-processing stage, run by `run_stages` once a site
+    is written. A stage is called with the Pelican instance, and checks by itself
+    whether the settings of the site enable it. Coroutine functions run in the event
+    loop of the scheduler, e.g. to wait on subprocesses, and other functions in a
+    thread of their own.
+
+    :param name: Name of the stage.
+    :param after: Names of the stages whose outputs the stage needs, e.g. to
+    fingerprint or compress them. Stages that aren't registered are ignored.
+    :return: The decorator, which returns the function unchanged.
+    """
+
+    def decorator(func):
+        _STAGES[name] = (func, tuple(after))
+        return func
+
+    return decorator
+
+
+async def _run_stage(instance, name, func, after, tasks, report, errors, total):
+    """
+    Run a stage once the stages it needs are done, and add its outcome to the report.
+
+    :param instance: The Pelican instance.
+    :param name: Name of the stage.
+    :param func: Function of the stage.
+    :param after: Names of the stages it needs.
+    :param tasks: `{name: Task}` dictionary of the stages that run.
+    :param report: `{name: outcome}` dictionary of the stages that ran.
+    :param errors: List of the exceptions raised by the stages that failed.
+    :param total: Number of stages.
+    """
+
+    needed = [stage for stage in after if stage in tasks]
+    if needed:
+        await asyncio.wait([tasks[stage] for stage in needed])
+    if failed := [stage for stage in needed if report[stage]["status"] != DONE]:
+        report[name] = {"status": SKIPPED, "time": 0,
+                        "error": f"needs {", ".join(failed)}"}
+        _LOGGER.warning(f"renn: Post-processing stage '{name}' skipped, as "
+                        f"{", ".join(failed)} didn't complete")
+        return
+
+    _LOGGER.debug(f"renn: Post-processing stage '{name}' started")
+    start = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(func):
+            await func(instance)
+        else:
+            await asyncio.to_thread(func, instance)
+    except Exception as e:
+        report[name] = {"status": FAILED, "time": time.perf_counter() - start,
+                        "error": f"{type(e).__name__}: {e}"}
+        errors.append(e)
+        _LOGGER.error(f"renn: Post-processing stage '{name}' failed: {e}",
+                      exc_info=True)
+    else:
+        report[name] = {"status": DONE, "time": time.perf_counter() - start,
+                        "error": None}
+    _LOGGER.info(f"renn: [{len(report)}/{total}] Post-processing stage '{name}' "
+                 f"{report[name]["status"]} in {report[name]["time"]:.2f}s")
+
+
+async def _run_stages(instance, stages):
+    """
+    :param instance: The Pelican instance.
+    :param stages: `{name: (function, after)}` dictionary of the stages to run.
+    :return: A `(report, errors)` tuple, with `report` the `{name: outcome}` dictionary
+    of the stages, in the order they ended, and `errors` the exceptions raised by the
+    stages that failed.
+    """
+
+    tasks = dict()
+    report = dict()
+    errors = []
+    order = TopologicalSorter({name: [stage for stage in after if stage in stages]
+                               for name, (_, after) in stages.items()}).static_order()
+    for name in order:
+        func, after = stages[name]
+        tasks[name] = asyncio.create_task(
+            _run_stage(instance, name, func, after, tasks, report, errors, len(stages))
+        )
+    await asyncio.gather(*tasks.values())
+    return report, errors
+
+
+def _run_scheduler(coroutine):
+    """
+    Run the scheduler in an event loop of its own. When Pelican itself runs in an event
+    loop (e.g. the `livereload` server of the quickstart tasks calls Pelican from its
+    IOLoop), a second loop can't run in the same thread, so it runs in another one.
+
+    :param coroutine: The coroutine of the scheduler.
+    :return: The result of the coroutine.
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+@profiled
+def run_stages(instance):
+    """
+    When Pelican is done writing the output directory, run the post-processing stages
+    concurrently (e.g. the Tailwind CSS CLI while thumbnails are generated), each one
+    after the stages it needs, and log a summary of their outcomes. A stage that fails
+    doesn't stop the others, except the ones that need it, but fails the build once
+    they are done.
+
+    :param instance: The Pelican instance.
+    :return: `{name: {"status", "time", "error"}}` dictionary of the stages.
+    :raise ExceptionGroup: If stages failed, with the exceptions they raised.
+    :raise graphlib.CycleError: If stages depend on each other.
+    """
+
+    if not _STAGES:
+        return dict()
+
+    start = time.perf_counter()
+    try:
+        report, errors = _run_scheduler(_run_stages(instance, dict(_STAGES)))
+    except CycleError as e:
+        _LOGGER.error(f"renn: Post-processing stages depend on each other: "
+                      f"{" -> ".join(e.args[1])}")
+        raise
+
+    counts = [f"{sum(outcome["status"] == status for outcome in report.values())} "
+              f"{status}" for status in (DONE, FAILED, SKIPPED)]
+    _LOGGER.info(f"renn: Post-processing finished in "
+                 f"{time.perf_counter() - start:.2f}s ({", ".join(counts)})")
+    for name, outcome in report.items():
+        if outcome["status"] != DONE:
+            _LOGGER.warning(f"renn: Post-processing stage '{name}' "
+                            f"{outcome["status"]}: {outcome["error"]}")
+    if errors:
+        raise ExceptionGroup("renn: Post-processing stages failed", errors)
+    return report
@@ -0,0 +1,287 @@
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+import inspect
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from .context import BuildContext
+
+_LOGGER = logging.getLogger(__name__)
+
+PROFILE_FORMATS = ("json", "chrome")
+
+
+def _peak_rss():
+    """
+    :return: Peak resident memory of the process since it started, in KiB, or `None` if
+    unknown.
+    """
+
+    if not resource:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Profiler:
+    """
+    Recorder of the time spent in the plugin during a build (the main site and its i18n
+    subsites). Each recorded span holds its wall and CPU time, and how much the peak
+    memory of the process grew while it ran. The peak of a process never decreases, so
+    a span that allocates less than an earlier one doesn't raise it; spans that run
+    concurrently share the growth.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.start = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """
+        Record the execution of a block of code.
+
+        :param name: Name of the span, e.g. the name of a signal handler.
+        :param category: Category of the span, e.g. `hook` or `thumbnail`.
+        :param args: Extra information about the span.
+        :return: A context manager.
+        """
+
+        start = time.perf_counter_ns()
+        cpu_start = time.thread_time_ns()
+        rss_start = _peak_rss()
+        try:
+            yield
+        finally:
+            event = {
+                "name": name,
+                "cat": category,
+                "ts": start,
+                "dur": time.perf_counter_ns() - start,
+                "cpu": time.thread_time_ns() - cpu_start,
+                "rss_growth": None if rss_start is None else _peak_rss() - rss_start,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": args,
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def summary(self):
+        """
+        Aggregate the recorded spans by name.
+
+        :return: A JSON-serializable dictionary.
+        """
+
+        spans = dict()
+        for event in self.events:
+            entry = spans.setdefault(event["name"], {
+                "category": event["cat"],
+                "calls": 0,
+                "wall_time": 0,
+                "cpu_time": 0,
+                "max_rss_growth_kib": None,
+            })
+            entry["calls"] += 1
+            entry["wall_time"] += event["dur"] / 1e9
+            entry["cpu_time"] += event["cpu"] / 1e9
+            if event["rss_growth"] is not None:
+                entry["max_rss_growth_kib"] = max(entry["max_rss_growth_kib"] or 0,
+                                                  event["rss_growth"])
+
+        return {
+            "wall_time": (time.perf_counter_ns() - self.start) / 1e9,
+            "spans": dict(sorted(spans.items(),
+                                 key=lambda item: item[1]["wall_time"],
+                                 reverse=True)),
+        }
+
+    def chrome_trace(self):
+        """
+        Convert the recorded spans to the Chrome trace event format, which can be
+        loaded in `chrome://tracing` or Perfetto.
+
+        :return: A JSON-serializable dictionary.
+        """
+
+        return {
+            "traceEvents": [
+                {
+                    "name": event["name"],
+                    "cat": event["cat"],
+                    "ph": "X",
+                    "ts": (event["ts"] - self.start) / 1e3,
+                    "dur": event["dur"] / 1e3,
+                    "pid": event["pid"],
+                    "tid": event["tid"],
+                    "args": {**event["args"], "cpu_ms": event["cpu"] / 1e6,
+                             "rss_growth_kib": event["rss_growth"]},
+                }
+                for event in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+
+def profiler(settings):
+    """
+    Retrieve the profiler of a build, creating it if needed.
+
+    :param settings: Pelican settings.
+    :return: The `Profiler` shared by the main site and its subsites, or `None` if
+    `RENN_PROFILE` is not set.
+    """
+
+    if not settings.get("RENN_PROFILE"):
+        return None
+
+    context = BuildContext.of(settings).main
+    if context.profiler is None:
+        with context.lock:
+            if context.profiler is None:
+                context.profiler = Profiler()
+    return context.profiler
+
+
+def span(settings, name, category="hook", **args):
+    """
+    Record the execution of a block of code if profiling is enabled.
+
+    :param settings: Pelican settings.
+    :param name: Name of the span.
+    :param category: Category of the span.
+    :param args: Extra information about the span.
+    :return: A context manager.
+    """
+
+    if prof := profiler(settings):
+        return prof.span(name, category, **args)
+    return nullcontext()
+
+
+def _settings_of(args):
+    """
+    Find the Pelican settings from the arguments of a signal handler (a Pelican
+    instance, a generator, the readers, a list of generators...), or from the active
+    build context.
+
+    :param args: Positional arguments of the handler.
+    :return: The settings, or `None` if they couldn't be found.
+    """
+
+    if args:
+        arg = args[0]
+        if isinstance(arg, list) and arg:
+            arg = arg[0]
+        if isinstance(settings := getattr(arg, "settings", None), dict):
+            return settings
+
+    try:
+        return BuildContext.current().settings
+    except RuntimeError:
+        return None
+
+
+def profiled(func=None, *, name=None, category="hook", settings=None):
+    """
+    Decorator that records the calls of a function (or coroutine function) if
+    profiling is enabled.
+
+    :param func: Function to decorate.
+    :param name: Name of the spans. The default is the qualified name of the function.
+    :param category: Category of the spans.
+    :param settings: Pelican settings, for functions whose arguments don't lead to
+    them (see `_settings_of`).
+    :return: The decorated function.
+    """
+
+    if func is None:
+        return partial(profiled, name=name, category=category, settings=settings)
+
+    span_name = name or func.__qualname__.replace(".<locals>", "")
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            prof = profiler(s) if (s := settings or _settings_of(args)) else None
+            if not prof:
+                return await func(*args, **kwargs)
+            with prof.span(span_name, category):
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        prof = profiler(s) if (s := settings or _settings_of(args)) else None
+        if not prof:
+            return func(*args, **kwargs)
+        with prof.span(span_name, category):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def write_profile(instance):
+    """
+    Once the main site and its subsites are written, write the profiling report.
+
+    :param instance: The Pelican instance.
+    """
+
+    context = BuildContext.of(instance.settings)
+    if context.main is not context or not (prof := profiler(instance.settings)):
+        return
+
+    profile_format = instance.settings["RENN_PROFILE_FORMAT"]
+    if profile_format not in PROFILE_FORMATS:
+        _LOGGER.error(f"renn: Unknown profile format '{profile_format}', expected one "
+                      f"of {", ".join(PROFILE_FORMATS)}")
+        return
+
+    path = Path(instance.settings["RENN_PROFILE"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with prof.lock:
+        report = prof.summary() if profile_format == "json" else prof.chrome_trace()
+    path.write_text(json.dumps(report, indent=2))
+    _LOGGER.info(f"renn: Build profile written to {path}")
+
+
+def collect_profile(pelican_obj):
+    """
+    Signal sent in the worker process of an i18n subsite built in parallel, which hands
+    the spans recorded by the worker back to the main process.
+
+    :param pelican_obj: The Pelican instance of the subsite.
+    :return: A callable that merges the spans in the main process.
+    """
+
+    if not (prof := profiler(pelican_obj.settings)):
+        return None
+
+    # The spans of the main site were inherited from the main process
+    pid = os.getpid()
+    with prof.lock:
+        events = [event for event in prof.events if event["pid"] == pid]
+    return partial(_merge_profile, events)
+
+
+def _merge_profile(events, pelican_obj):
+    """
+    :param events: Spans recorded by a subsite worker.
+    :param pelican_obj: The main Pelican instance.
+    """
+
+    if prof := profiler(pelican_obj.settings):
+        with prof.lock:
+            prof.events.extend(events)
@@ -1,19 +1,48 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 import hashlib
+import json
+import logging
+from pathlib import Path
+from urllib.parse import urlsplit
 
 from docutils import nodes
 from docutils.writers.html5_polyglot import HTMLTranslator
 from docutils.core import publish_parts
 from docutils.utils import new_document
 from docutils.parsers.rst import Directive, directives
-from jinja2 import PackageLoader, PrefixLoader, TemplateNotFound
+from jinja2 import PackageLoader, PrefixLoader, TemplateNotFound, meta
 from pelican.plugins.i18n_subsites import relpath_to_site
 
+from .context import BuildContext
+from .dependencies import dependency_graph
+from .image_metadata import image_metadata
 from .jinja_filters import parse_link
+from .profiling import profiled
+from .thumbnail import ResizeSpec, path_to_dict, register_image
 
-jinja_env = None
-jinja_context = None
-readers = None
+# Side effects of the directives for the document being recorded, if any
+_journal = ContextVar("renn_journal", default=None)
+_LOGGER = logging.getLogger(__name__)
 
+LAZY_MODES = ("none", "fragments", "bundle")
+
+
+def bind(generator):
+    """
+    Set the jinja environment and readers used by the directives in the build context.
+
+    :param generator: The generator instance.
+    :return: The `BuildContext` of the generator.
+    """
+
+    context = BuildContext.of(generator.settings)
+    context.jinja_env = generator.env
+    context.readers = generator.readers
+    return context
+
+
+@profiled
 def register_templates(generator):
     """
     Callable for the `generator_init` signal that retrieves the jinja environment and
@@ -22,20 +51,259 @@ def register_templates(generator):
     :param generator: The generator instance.
     """
 
-    global jinja_env
-    global jinja_context
-    global readers
-    jinja_env = generator.env
-    jinja_context = generator.settings
-    readers = generator.readers
+    bind(generator)
 
     plugin_templates = PackageLoader("pelican_renn_plugin", "templates")
 
-    jinja_env.loader.loaders.append(PrefixLoader({
+    generator.env.loader.loaders.append(PrefixLoader({
         "!renn": plugin_templates,
     }))
 
 
+@contextmanager
+def recording():
+    """
+    Record the side effects of the directives (templates used, lazy popover contents
+    and registered images) while a document is parsed. While recording, the side
+    effects are deferred until `replay` is called, so that a document can be parsed in
+    another process, or loaded from a cache.
+
+    :return: A context manager that yields the list of recorded entries.
+    """
+
+    journal = []
+    token = _journal.set(journal)
+    try:
+        yield journal
+    finally:
+        _journal.reset(token)
+
+
+def _record(*entry):
+    """
+    Add an entry to the journal, if a document is being recorded.
+
+    :param entry: Entry items; the first one is the type of the entry.
+    :return: `True` if the entry was recorded, `False` otherwise.
+    """
+
+    journal = _journal.get()
+    if journal is None:
+        return False
+    journal.append(list(entry))
+    return True
+
+
+def replay(entries):
+    """
+    Apply the side effects recorded by `recording` to the active build context.
+
+    :param entries: Recorded entries.
+    """
+
+    for kind, *args in entries:
+        match kind:
+            case "fragment":
+                add_fragment(*args)
+            case "image":
+                register_image(BuildContext.current(), *args)
+
+
+def add_fragment(save_as, content, popover_id=None):
+    """
+    Queue a lazy popover file to be written at the end of the build.
+
+    :param save_as: Path of the file, relative to `OUTPUT_PATH`.
+    :param content: Content of the popover.
+    :param popover_id: ID of the popover if the file is a bundle, `None` otherwise.
+    """
+
+    if _record("fragment", save_as, content, popover_id):
+        return
+
+    context = BuildContext.current()
+    with context.lock:
+        if popover_id:
+            context.fragments.setdefault(save_as, {})[popover_id] = content
+        else:
+            context.fragments[save_as] = content
+
+
+def get_template(name, fallback):
+    """
+    Retrieve a template from the jinja environment.
+
+    :param name: Name of the template.
+    :param fallback: Name of the template to use if `name` doesn't exist.
+    :return: A jinja `Template`.
+    """
+
+    _record("templates", name, fallback)
+
+    jinja_env = BuildContext.current().jinja_env
+    try:
+        return jinja_env.get_template(name)
+    except TemplateNotFound:
+        return jinja_env.get_template(fallback)
+
+
+def template_digest(names):
+    """
+    Compute a digest of the source of templates and of all the templates they
+    reference. Missing templates are part of the digest, so that a template that is
+    later added to the theme changes the digest as well.
+
+    :param names: Names of the templates.
+    :return: A hexadecimal digest.
+    """
+
+    context = BuildContext.current()
+    jinja_env = context.jinja_env
+    key = tuple(sorted(names))
+    if key in context.template_digests:
+        return context.template_digests[key]
+
+    digest = hashlib.sha256()
+    seen = set()
+    stack = list(key)
+    while stack:
+        name = stack.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            source, _, _ = jinja_env.loader.get_source(jinja_env, name)
+        except TemplateNotFound:
+            digest.update(f"{name}\0missing\0".encode())
+            continue
+        digest.update(f"{name}\0{source}\0".encode())
+        stack.extend(reference for reference
+                     in meta.find_referenced_templates(jinja_env.parse(source))
+                     if reference)
+
+    context.template_digests[key] = digest.hexdigest()
+    return context.template_digests[key]
+
+
+@profiled
+def write_fragments(instance):
+    """
+    When Pelican is done writing the output directory, this post-process pass writes
+    the lazy popover contents collected by the `project` directives.
+
+    :param instance: The Pelican instance.
+    """
+
+    context = BuildContext.of(instance.settings)
+    graph = dependency_graph(instance.settings)
+    with context.lock:
+        fragments, context.fragments = context.fragments, dict()
+    written = 0
+    for save_as, content in fragments.items():
+        output_path = Path(instance.settings["OUTPUT_PATH"])/save_as
+        # Bundles are a mapping of popover IDs to their content
+        if isinstance(content, dict):
+            content = json.dumps(content)
+        # Unchanged files are kept as they are, e.g. for the browser caches
+        if graph:
+            inputs = {"content": graph.value(content)}
+            if not graph.check("fragments", output_path, inputs):
+                continue
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(content, encoding="utf-8")
+        written += 1
+        if graph:
+            graph.record("fragments", output_path, inputs)
+        _LOGGER.debug(f"renn: {output_path} was created")
+    if written:
+        _LOGGER.info(f"renn: Wrote {written} lazy popover file(s)")
+
+
+def image_variants(image, document_settings=None):
+    """
+    Register a project image with the thumbnail subsystem, and compute the sized
+    variants of the image for the project tile.
+
+    :param image: URI of the image, relative to `OUTPUT_PATH` or to its root. Absolute
+    URLs have no variants.
+    :param document_settings: docutils settings of the document, whose
+    `record_dependencies` receive the image, so that a cached document is parsed
+    again when the image changes.
+    :return: A `(srcset, width, height)` tuple, with `srcset` a list of `(path, width)`
+    tuples sorted by width, and `width` and `height` the dimensions of the original
+    image. If there are no variants, `([], None, None)` is returned.
+    """
+
+    context = BuildContext.current()
+    settings = context.settings
+    resizes = settings["PROJECTS_IMAGE_RESIZES"]
+    if not (resizes and settings["THUMBNAIL_ENABLE"]):
+        return [], None, None
+
+    # Images hosted elsewhere have no thumbnails, and root-relative URIs are relative to
+    # the output directory like the others
+    if urlsplit(image).scheme or image.startswith("//"):
+        return [], None, None
+    image = image.lstrip("/")
+
+    specs = dict()  # {resize: ResizeSpec}
+    for resize in resizes:
+        try:
+            resize_spec = ResizeSpec(settings["THUMBNAIL_RESIZES"][resize])
+        except KeyError:
+            _LOGGER.warning(f"renn: Unknown resize spec '{resize}' in "
+                            f"PROJECTS_IMAGE_RESIZES")
+            continue
+        # Browsers pick a candidate by its width only, so cropped or deformed variants
+        # would be displayed with the aspect ratio of the original image
+        if not resize_spec.keeps_aspect_ratio:
+            _LOGGER.warning(f"renn: Resize spec '{resize}' of PROJECTS_IMAGE_RESIZES "
+                            f"doesn't keep the aspect ratio of the image, it is "
+                            f"skipped")
+            continue
+        specs[resize] = resize_spec
+    if not specs:
+        return [], None, None
+
+    if not _record("image", image, list(specs)):
+        register_image(context, image, specs)
+
+    # The image is not copied to the output directory yet, so we read its size from the
+    # content directory
+    image_path = Path(settings["PATH"])/image
+    if document_settings is not None:
+        document_settings.record_dependencies.add(str(image_path))
+    info = image_metadata(settings).get(image_path, context.pil)
+    if not info or info.error:
+        _LOGGER.warning(f"renn: Couldn't read the size of project image {image}")
+        return [], None, None
+    # Browsers apply the EXIF orientation of the image, as the thumbnails are rotated
+    width, height = info.display_size
+
+    # {width: path}, so that there is a single candidate per width
+    candidates = {width: image}
+    for resize, resize_spec in specs.items():
+        resized = resize_spec.output_size(width, height)
+        candidates.setdefault(resized[0], settings["THUMBNAIL_SAVE_AS"].format(
+            resize=resize,
+            resize_spec=str(resize_spec),
+            **path_to_dict(image)
+        ))
+
+    return [(path, w) for w, path in sorted(candidates.items())], width, height
+
+
+def lazy_mode(argument):
+    """
+    Conversion function for the `lazy` option of the `projects` directive.
+
+    :param argument: Raw option value.
+    :return: One of `LAZY_MODES`.
+    """
+
+    return directives.choice(argument, LAZY_MODES)
+
+
 class ProjectDirective(Directive):
     """
     A nested directive for the `ProjectsDirective`, that creates a single element.
@@ -51,18 +319,15 @@ class ProjectDirective(Directive):
     }
     has_content = True
 
+    @profiled(category="directive")
     def run(self):
         """
         Create a list element for the project.
         """
 
-        try:
-            template = jinja_env.get_template(self.options.get(
-                "template",
-                "snippets/project.html"
-            ))
-        except TemplateNotFound:
-            template = jinja_env.get_template("!renn/snippets/project.html")
+        jinja_context = BuildContext.current().settings
+        template = get_template(self.options.get("template", "snippets/project.html"),
+                                "!renn/snippets/project.html")
 
         # Ensure we are inside a projects-modal
         if not "projects-temp-container" in self.state.parent["classes"]:
@@ -72,26 +337,35 @@ class ProjectDirective(Directive):
                 line=self.lineno
             )]
 
+        lazy = self.state.parent.get("lazy", "none")
         title = self.arguments[0]
         try:
             image = self.options["image"]
         except KeyError:
             raise AttributeError("Missing option 'image'")
+        srcset, width, height = image_variants(image, self.state.document.settings)
         raw_links = self.options.get("links", "")
         links = [parse_link(link.strip()) for link in
                  raw_links.split(",")] if raw_links else []
 
-        # ID of the popover, which should be (probably) unique
-        popover_id = f"project-{hashlib.md5(str(id(self)).encode()).hexdigest()}"
+        # ID of the popover, derived from its location so that it is stable across
+        # builds and unique across pages (lazy popover files are named after it)
+        source = self.state.document.get("source", "")
+        popover_id = "project-" + hashlib.md5(
+            f"{source}:{self.lineno}:{title}".encode()
+        ).hexdigest()
 
         # Settings for rendering the project popover content
         settings = self.state.document.settings.copy()
         # The popover title is level 2
         settings.initial_header_level = "3"
 
-        return [nodes.raw("", template.render(
+        project_context = dict(
             project_title=title,
             project_image=image,
+            project_srcset=srcset,
+            project_width=width,
+            project_height=height,
             project_links=links,
             project_content=publish_parts(
                 source="\n".join(self.content),
@@ -102,6 +376,29 @@ class ProjectDirective(Directive):
             # For some fucking reason this is not present in jinja_context, hence the
             # manual inclusion to the render context (I hate this library omg)
             relpath_to_site=relpath_to_site,
+        )
+
+        # With lazy popovers, the popover content is rendered on its own and stored
+        # in a separate file, and the tile only carries its URL
+        fragment = None
+        if lazy != "none":
+            popover = get_template(
+                "snippets/project_popover.html",
+                "!renn/snippets/project_popover.html",
+            ).render(**project_context, **jinja_context)
+            fragments_path = jinja_context["PROJECTS_FRAGMENTS_PATH"]
+            if lazy == "bundle":
+                bundle_id = hashlib.md5(source.encode()).hexdigest()
+                fragment = f"{fragments_path}/{bundle_id}.json"
+                add_fragment(fragment, popover, popover_id)
+            else:
+                fragment = f"{fragments_path}/{popover_id}.html"
+                add_fragment(fragment, popover)
+
+        return [nodes.raw("", template.render(
+            project_lazy=lazy,
+            project_fragment=fragment,
+            **project_context,
             **jinja_context
         ), format="html")]
 
@@ -115,22 +412,22 @@ class ProjectsDirective(Directive):
 
     option_spec = {
         "template": directives.unchanged,
+        "lazy": lazy_mode,
     }
 
+    @profiled(category="directive")
     def run(self):
         """
         Create a bullet list node and populate it with the contents of the directive.
         """
 
-        try:
-            template = jinja_env.get_template(self.options.get(
-                "template",
-                "snippets/projects.html"
-            ))
-        except TemplateNotFound:
-            template = jinja_env.get_template("!renn/snippets/projects.html")
+        jinja_context = BuildContext.current().settings
+        template = get_template(self.options.get("template", "snippets/projects.html"),
+                                "!renn/snippets/projects.html")
 
-        container = nodes.container(classes=["projects-temp-container"])
+        lazy = self.options.get("lazy",
+                                jinja_context["PROJECTS_LAZY_POPOVERS"] or "none")
+        container = nodes.container(classes=["projects-temp-container"], lazy=lazy)
         self.state.nested_parse(self.content, self.content_offset, container)
 
         wrapped = []
@@ -152,5 +449,17 @@ class ProjectsDirective(Directive):
         return [nodes.raw("", template.render(
             projects=[c.astext() for c in container.children],
             wrapped=reversed(wrapped),
+            lazy=lazy,
             **jinja_context
         ), format="html")]
+
+
+def register_directives(instance):
+    """
+    Signal that registers the `projects` and `project` directives.
+
+    :param instance: The Pelican instance.
+    """
+
+    directives.register_directive("projects", ProjectsDirective)
+    directives.register_directive("project", ProjectDirective)
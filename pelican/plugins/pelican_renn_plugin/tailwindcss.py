@@ -1,26 +1,113 @@
 # Based on the original Tailwind CSS plugin for Pelican https://github.com/pelican-plugins/tailwindcss/
 
+import asyncio
+import hashlib
 import os
 import logging
+import re
 
 from importlib import import_module
 from pathlib import Path
 
-pytailwindcss = None
+from .context import BuildContext
+from .dependencies import OUTPUT_MISSING, dependency_graph
+from .plan import orphaned_outputs, stage_plan
+from .postprocessing import post_processing_stage
+from .profiling import profiled, span
+
 _LOGGER = logging.getLogger(__name__)
 
+# Files the Tailwind CSS CLI may find classes in
+SOURCE_SUFFIXES = {".html", ".jinja", ".j2", ".rst", ".md", ".markdown", ".js"}
+
+# Classes set by content: HTML `class` attributes, reST `:class:` options and `class`
+# or `container` directives, and Markdown attribute lists
+CLASS_PATTERN = re.compile(
+    r"""\bclass(?:Name)?\s*=\s*(?:"([^"]*)"|'([^']*)')"""
+    r"|:class:[ \t]*(.*)"
+    r"|^[ \t]*\.\.[ \t]+(?:class|container)::[ \t]*(.*)"
+    r"|\{:?[ \t]*((?:[^}\n]*[ \t])?\.[^}\n]*)\}",
+    re.MULTILINE
+)
+
+
+def _class_digest(path):
+    """
+    Fingerprint the classes a content file uses, so that editing its text doesn't
+    compile the CSS again.
+
+    :param path: Path of the content file.
+    :return: A hexadecimal digest, or `None` if the file can't be read.
+    """
+
+    try:
+        text = Path(path).read_text("utf-8", errors="replace")
+    except OSError:
+        return None
+
+    classes = set()
+    for match in CLASS_PATTERN.finditer(text):
+        *values, attributes = match.groups()
+        classes.update(class_name for value in values if value
+                       for class_name in value.split())
+        if attributes:
+            classes.update(token[1:] for token in attributes.split()
+                           if token.startswith("."))
+    return hashlib.sha256("\n".join(sorted(classes)).encode()).hexdigest()
+
 
-def compile_css_file(input_file, tw_config, version, instance):
+def _tailwind_inputs(graph, instance, input_file, tw_config, version):
     """
-    Compile a single CSS file and put it in its output directory
+    Fingerprint the inputs of a Tailwind CSS output: the input file, the configuration
+    file, the CLI options, the templates, and the content files (or only the classes
+    they use, with `TAILWINDCSS_CLASS_FINGERPRINT`).
+
+    :param graph: `DependencyGraph` of the site.
+    :param instance: Pelican instance.
+    :param input_file: Path to the input CSS file.
+    :param tw_config: Tailwind CSS configuration file.
+    :param version: Tailwind CSS version to use.
+    :return: A `{name: fingerprint}` dictionary.
+    """
+
+    inputs = {
+        f"file:{input_file.resolve()}": graph.file(input_file.resolve()),
+        "setting:TAILWINDCSS_VERSION": graph.value(version),
+        "setting:TAILWINDCSS_MINIFY": graph.value(
+            instance.settings["TAILWINDCSS_MINIFY"]),
+    }
+    if tw_config:
+        inputs[f"file:{tw_config.resolve()}"] = graph.file(tw_config.resolve())
+
+    content_fingerprint = _class_digest \
+        if instance.settings["TAILWINDCSS_CLASS_FINGERPRINT"] else None
+    for root, fingerprint in ((Path(instance.theme)/"templates", None),
+                              (Path(__file__).parent/"templates", None),
+                              (Path(instance.path), content_fingerprint)):
+        for dirpath, _, filenames in root.resolve().walk():
+            for filename in filenames:
+                if os.path.splitext(filename)[1] in SOURCE_SUFFIXES:
+                    inputs[f"file:{dirpath/filename}"] = graph.file(dirpath/filename,
+                                                                    fingerprint)
+    return inputs
+
+
+async def compile_css_file(input_file, tw_config, version, instance):
+    """
+    Compile a single CSS file and put it in its output directory. The Tailwind CSS CLI
+    runs as a subprocess, so that other post-processing stages run meanwhile.
 
     :param input_file: Path to the input CSS file.
     :param tw_config: Tailwind CSS configuration file.
     :param version: Tailwind CSS version to use.
     :param instance: Pelican instance.
+    :raise RuntimeError: If the Tailwind CSS CLI fails.
     """
 
-    global pytailwindcss
+    pytailwindcss = BuildContext.of(instance.settings).tailwindcss
+    graph = dependency_graph(instance.settings)
+    # In dry-run mode, the CSS files are only planned
+    plan = stage_plan(instance.settings, "tailwindcss")
 
     # For each static path (content and theme static path), compute the destination
     static_paths = [
@@ -42,21 +129,49 @@ def compile_css_file(input_file, tw_config, version, instance):
         # If found, resolve the output path and run Tailwind CSS CLI
         if input_file.resolve().is_relative_to(static_path):
             output_path = output_dir/input_file.resolve().relative_to(static_path)
-            command = f"-i {input_file} -o {output_path} " \
-                      f"{f"-c {tw_config}" if tw_config else ""} " \
-                      f"{"--minify" if instance.settings["TAILWINDCSS_MINIFY"] else ""}"
+            args = ["-i", str(input_file), "-o", str(output_path)]
+            if tw_config:
+                args += ["-c", str(tw_config)]
+            if instance.settings["TAILWINDCSS_MINIFY"]:
+                args.append("--minify")
+            reason = None
+            if graph:
+                inputs = _tailwind_inputs(graph, instance, input_file, tw_config,
+                                          version)
+                # Pelican may have copied the input file over the compiled CSS
+                if not (reason := graph.check("tailwindcss", output_path, inputs,
+                                              restore=True)):
+                    _LOGGER.info(f"renn: {output_path} is up to date")
+                    if plan is not None:
+                        plan["up_to_date"].append(str(output_path))
+                    continue
+            if plan is not None:
+                plan["jobs"].append({
+                    "output": str(output_path),
+                    "input": str(input_file),
+                    "action": "replace" if output_path.exists() else "create",
+                    "reason": reason or (OUTPUT_MISSING if not output_path.exists()
+                                         else "output not tracked"),
+                    "input_bytes": input_file.stat().st_size,
+                })
+                continue
             _LOGGER.info(f"renn: Compiling {input_file} into {output_path}")
-            _LOGGER.debug(f"Running `{command}`")
-            process = pytailwindcss.run(
-                command,
-                env=os.environ.copy(),
-                cwd=os.getcwd(),
-                live_output=True,
-                version=version
-            )
+            _LOGGER.debug(f"Running `{" ".join(args)}`")
+            with span(instance.settings, "tailwindcss", "tailwind",
+                      input=str(input_file)):
+                process = await asyncio.create_subprocess_exec(
+                    pytailwindcss.utils.get_bin_path(version),
+                    *args,
+                    env=os.environ.copy(),
+                    cwd=os.getcwd(),
+                )
+                await process.wait()
             if process.returncode != 0:
-                _LOGGER.error(f"renn: Tailwind CSS CLI returned a non-zero exit code "
-                              f"({process.returncode})")
+                raise RuntimeError(f"Tailwind CSS CLI exited with "
+                                   f"{process.returncode} while compiling "
+                                   f"{input_file}")
+            if graph:
+                graph.record("tailwindcss", output_path, inputs, stash=True)
     else:
         # Usually not an issue: with i18n-subsites, translated websites cross-link
         # static files, so this is totally expected
@@ -81,27 +196,29 @@ def resolve_tailwind_version(version):
     ).json()[0]["name"]
 
 
-def pytailwindcss_module():
+def pytailwindcss_module(instance):
     """
     Fetch the `pytailwindcss` module and import it if necessary.
 
+    :param instance: The Pelican instance.
     :return: The `pytailwindcss` Python module, or `None` if the module couldn't be
     loaded.
     """
 
-    global pytailwindcss
+    context = BuildContext.of(instance.settings)
 
     # Try to import the pytailwindcss module
-    if not pytailwindcss:
+    if not context.tailwindcss:
         try:
-            pytailwindcss = import_module("pytailwindcss")
+            context.tailwindcss = import_module("pytailwindcss")
         except ModuleNotFoundError:
             _LOGGER.error("renn: 'TAILWINDCSS_ENABLE' is set to True but the "
                           "pytailwindcss module was not found.")
 
-    return pytailwindcss
+    return context.tailwindcss
 
 
+@profiled
 def load_tailwind(instance):
     """
     Preflight procedure to ensure Tailwind CLI is available, and install it if needed.
@@ -111,7 +228,7 @@ def load_tailwind(instance):
 
     # Don't do anything if Tailwind is disabled or not available
     if not (instance.settings["TAILWINDCSS_ENABLE"]
-            and (twcss := pytailwindcss_module())):
+            and (twcss := pytailwindcss_module(instance))):
         return
 
     # If needed, install the required version
@@ -122,17 +239,22 @@ def load_tailwind(instance):
     _LOGGER.info(f"renn: Using Tailwind CSS CLI {version}")
 
 
-def compile_css(instance):
+@post_processing_stage("tailwindcss")
+@profiled
+async def compile_css(instance):
     """
     When Pelican is done writing the output directory, this post-process pass compiles
-    the Tailwind CSS files and copy them at the correct output location.
+    the Tailwind CSS files and copy them at the correct output location. The files are
+    compiled concurrently.
 
     :param instance: The Pelican instance.
+    :raise RuntimeError: If the Tailwind CSS CLI fails for a file.
+    :raise ExceptionGroup: If it fails for several files.
     """
 
     # Don't do anything if Tailwind is disabled or not available
     if not (instance.settings["TAILWINDCSS_ENABLE"]
-            and (twcss := pytailwindcss_module())):
+            and (twcss := pytailwindcss_module(instance))):
         return
 
     version = resolve_tailwind_version(instance.settings["TAILWINDCSS_VERSION"])
@@ -148,9 +270,22 @@ def compile_css(instance):
         _LOGGER.info(f"renn: Using Tailwind CSS config file '{tw_config}'")
 
     # Compile each Tailwind CSS input file
+    jobs = []
     for input_file in instance.settings["TAILWINDCSS_INPUT_FILES"]:
         input_file = Path(input_file)
         if not input_file.exists():
             _LOGGER.error(f"renn: {input_file} not found")
             continue
-        compile_css_file(input_file, tw_config, version, instance)
+        jobs.append(compile_css_file(input_file, tw_config, version, instance))
+    # The other files are still compiled when one of them fails
+    errors = [result for result in await asyncio.gather(*jobs, return_exceptions=True)
+              if isinstance(result, BaseException)]
+    if len(errors) == 1:
+        raise errors[0]
+    if errors:
+        raise ExceptionGroup("renn: Tailwind CSS compilation failed", errors)
+
+    if (plan := stage_plan(instance.settings, "tailwindcss")) is not None:
+        planned = [job["output"] for job in plan["jobs"]] + plan["up_to_date"]
+        plan["orphaned"] += orphaned_outputs(dependency_graph(instance.settings),
+                                             "tailwindcss", planned)
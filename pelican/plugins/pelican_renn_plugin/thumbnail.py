@@ -1,13 +1,30 @@
 # Partially based on https://github.com/pelican-plugins/thumbnailer
 
+import hashlib
 import logging
+import os
+import shutil
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from importlib import import_module
 from pathlib import Path
 
-pil_imports = None
+from .context import BuildContext
+from .dependencies import OUTPUT_MISSING, dependency_graph
+from .image_metadata import ORIENTATION_TAG, TRANSPOSED_ORIENTATIONS, image_metadata
+from .plan import orphaned_outputs, stage_plan
+from .postprocessing import post_processing_stage
+from .profiling import profiled, span
+
 _LOGGER = logging.getLogger(__name__)
 
+# Bump this whenever the thumbnails of the same image and resize spec change, so that
+# cached and recorded thumbnails are generated again
+THUMBNAIL_VERSION = 2
+
 
 class ResizeSpec:
     """
@@ -61,11 +78,12 @@ class ResizeSpec:
            (self.h is not None and self.h <= 0):
             raise ValueError("Dimensions should be strictly positive integers")
 
-    def __call__(self, image):
+    def __call__(self, image, pil=None):
         """
         Perform the resize operation.
 
         :param image: A Pillow image.
+        :param pil: The Pillow imports, as loaded by `load_pillow`.
         :return: A new, resized image.
         """
 
@@ -74,27 +92,67 @@ class ResizeSpec:
             return self.custom_callback(image)
 
         # If we don't have a custom callback, Pillow is a hard requirement
-        if not pil_imports:
+        if not pil:
             raise RuntimeError("Pillow is not installed")
 
         # Operations where the image is not deformed
         if self.keep_aspect:
             # We crop if both dimensions are set
             if self.w and self.h:
-                result = pil_imports.ImageOps.fit(
-                    image, (self.w, self.h), pil_imports.Image.BICUBIC)
+                result = pil.ImageOps.fit(
+                    image, (self.w, self.h), pil.Image.BICUBIC)
             # Otherwise, it is a thumbnail resizing
             else:
                 result = image.copy()
                 result.thumbnail((self.w or image.width, self.h or image.height),
-                                 pil_imports.Image.LANCZOS)
+                                 pil.Image.LANCZOS)
         # Operation where the image is deformed
         else:
             result = image.resize((self.w or image.width, self.h or image.height),
-                                  pil_imports.Image.LANCZOS)
+                                  pil.Image.LANCZOS)
 
         return result
 
+    def output_size(self, width, height):
+        """
+        Compute the size of the resized image without performing the operation.
+
+        :param width: Width of the original image.
+        :param height: Height of the original image.
+        :return: A `(width, height)` tuple, or `None` if the size can't be known in
+        advance (custom callbacks).
+        """
+
+        if self.custom_callback:
+            return None
+
+        # Cropped to the exact dimensions
+        if self.keep_aspect and self.w and self.h:
+            return self.w, self.h
+        # Deformed to the requested dimensions
+        if not self.keep_aspect:
+            return self.w or width, self.h or height
+
+        # Thumbnail resizing, which keeps the aspect ratio and never upscales
+        box_w, box_h = self.w or width, self.h or height
+        if width > box_w:
+            height = max(round(height * box_w / width), 1)
+            width = box_w
+        if height > box_h:
+            width = max(round(width * box_h / height), 1)
+            height = box_h
+        return width, height
+
+    @property
+    def keeps_aspect_ratio(self):
+        """
+        :return: Whether the resized image has the aspect ratio of the original image,
+        i.e. it is neither cropped nor deformed. This is unknown for custom callbacks.
+        """
+
+        return (self.keep_aspect and not (self.w and self.h)
+                and not self.custom_callback)
+
     def __str__(self):
         """
         Create the resize_spec string. See `README.md` for more information.
@@ -138,6 +196,7 @@ def path_to_dict(path):
     }
 
 
+@profiled
 def load_pillow(instance):
     """
     Preflight procedure to ensure Pillow is available and import it, only if the
@@ -146,24 +205,189 @@ def load_pillow(instance):
     :param instance: The Pelican instance.
     """
 
-    global pil_imports
-
     # Don't do anything if the feature is disabled
     if not instance.settings["THUMBNAIL_ENABLE"]:
         return
 
-    if not pil_imports:
+    context = BuildContext.of(instance.settings)
+    if not context.pil:
         try:
             class PIL:
                 Image = import_module(".Image", "PIL")
                 ImageOps = import_module(".ImageOps", "PIL")
 
-            pil_imports = PIL
+            context.pil = PIL
         except ModuleNotFoundError:
             _LOGGER.error("renn: 'THUMBNAIL_ENABLE' is set to True but the PIL package "
                           "was not found.")
 
 
+def register_image(context, path, resizes):
+    """
+    Register an image so that its thumbnails are generated even if it isn't under any
+    of the `THUMBNAIL_PATHS`.
+
+    :param context: `BuildContext` of the build.
+    :param path: Path of the image, relative to `OUTPUT_PATH`.
+    :param resizes: Names of the resize specs to generate.
+    """
+
+    with context.lock:
+        context.images.setdefault(str(path), set()).update(resizes)
+
+
+def collect_subsite_images(pelican_obj):
+    """
+    Signal sent in the worker process of an i18n subsite built in parallel, which hands
+    the images forwarded to the main site back to the main process.
+
+    :param pelican_obj: The Pelican instance of the subsite.
+    :return: A callable that registers the images in the main process.
+    """
+
+    main = BuildContext.of(pelican_obj.settings).main
+    with main.lock:
+        images, main.images = main.images, dict()
+    return partial(_merge_subsite_images, images) if images else None
+
+
+def _merge_subsite_images(images, pelican_obj):
+    """
+    :param images: Images forwarded to the main site by a subsite worker.
+    :param pelican_obj: The main Pelican instance.
+    """
+
+    context = BuildContext.of(pelican_obj.settings)
+    for path, resizes in images.items():
+        register_image(context, path, resizes)
+
+
+def _pixel_limit(settings, pil, resize):
+    """
+    :param settings: Pelican settings.
+    :param pil: The Pillow imports, as loaded by `load_pillow`.
+    :param resize: Name of the resize spec.
+    :return: The maximum number of pixels of the images thumbnailed with the resize
+    spec, or `None` if only Pillow's limit applies.
+    """
+
+    limit = settings["THUMBNAIL_MAX_PIXELS"]
+    if isinstance(limit, dict):
+        limit = limit.get(resize)
+    # Pillow refuses to open images with more than twice its own limit, whatever ours
+    pillow_limit = pil.Image.MAX_IMAGE_PIXELS
+    if limit and pillow_limit and limit > 2 * pillow_limit:
+        _LOGGER.warning(f"renn: THUMBNAIL_MAX_PIXELS is {limit} for '{resize}', but "
+                        f"Pillow refuses images with more than {2 * pillow_limit} "
+                        f"pixels")
+    return limit
+
+
+def _draft_size(output_size):
+    """
+    :param output_size: Size of the thumbnail.
+    :return: The smallest size an image can be decoded at (e.g. JPEG images, which
+    can be decoded at a fraction of their size) to compute the thumbnail, as Pillow
+    does for `Image.thumbnail`.
+    """
+
+    return output_size[0] * 2, output_size[1] * 2
+
+
+def _memory_footprint(info, output_size):
+    """
+    Estimate the memory needed to compute a thumbnail: the decoded image, a copy of
+    it, and the thumbnail.
+
+    :param info: `ImageInfo` of the image.
+    :param output_size: Size of the thumbnail, or `None` if it is unknown.
+    :return: A number of bytes.
+    """
+
+    (width, height), mode = info.display_size, info.mode
+    if info.format == "JPEG" and output_size:
+        # Pillow decodes JPEG images at 1/8, 1/4 or 1/2 of their size (see `draft`)
+        draft_w, draft_h = _draft_size(output_size)
+        scale = min(width // draft_w, height // draft_h)
+        scale = next(s for s in (8, 4, 2, 1) if scale >= s or s == 1)
+        width, height = -(-width // scale), -(-height // scale)
+    # Pillow stores single-band 8-bit images on 1 byte per pixel, 16-bit ones on 2,
+    # and the others on 4
+    pixel_bytes = 1 if mode in ("1", "L", "P") else 2 if mode.startswith("I;16") else 4
+    output_bytes = output_size[0] * output_size[1] * 4 if output_size else 0
+    return 2 * width * height * pixel_bytes + output_bytes
+
+
+class MemoryBudget:
+    """
+    Admission control of the thumbnails computed in parallel, so that their estimated
+    memory stays within a budget. A thumbnail that needs more than the budget is
+    computed alone.
+    """
+
+    def __init__(self, budget):
+        """
+        :param budget: Budget in bytes.
+        """
+
+        self.budget = budget
+        self.used = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, size):
+        """
+        Wait until some memory fits in the budget, and reserve it.
+
+        :param size: Number of bytes.
+        :return: A context manager, which releases the memory on exit.
+        """
+
+        with self.condition:
+            self.condition.wait_for(lambda: not self.used
+                                    or self.used + size <= self.budget)
+            self.used += size
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.used -= size
+                self.condition.notify_all()
+
+
+def _plan_job(output_path, input_path, resize, resize_spec, info, footprint, reason,
+              cache):
+    """
+    Describe a thumbnail that would be generated, for the dry-run plan.
+
+    :param output_path: Path of the thumbnail.
+    :param input_path: Path of the image.
+    :param resize: Name of the resize spec.
+    :param resize_spec: `ResizeSpec` object.
+    :param info: `ImageInfo` of the image.
+    :param footprint: Estimated memory of the thumbnail, in bytes.
+    :param reason: Reason the thumbnail would be generated.
+    :param cache: `ThumbnailCache` of the build, or `None`.
+    :return: A JSON-serializable dictionary.
+    """
+
+    output_size = resize_spec.output_size(*info.display_size)
+    entry_path = cache.entry_path(input_path, resize, resize_spec, output_path.suffix) \
+        if cache else None
+    return {
+        "output": str(output_path),
+        "input": str(input_path),
+        "resize": resize,
+        "action": "replace" if output_path.exists() else "create",
+        "reason": reason,
+        "pixels": info.pixels,
+        "output_pixels": output_size[0] * output_size[1] if output_size else None,
+        "input_bytes": info.file_size,
+        "memory_bytes": footprint,
+        "cache": None if not entry_path else "hit" if entry_path.exists() else "miss",
+    }
+
+
 def _parse_output_path(input_path, save_as, resize, resize_spec):
     """
     Small subroutine to parse the output path.
@@ -182,6 +406,142 @@ def _parse_output_path(input_path, save_as, resize, resize_spec):
     ))
 
 
+def _resize(pil, input_path, resize_spec, output_path):
+    """
+    Resize an image and save the result.
+
+    :param pil: The Pillow imports, as loaded by `load_pillow`.
+    :param input_path: Path of the image.
+    :param resize_spec: `ResizeSpec` object.
+    :param output_path: Path of the resized image.
+    :return: `True` if the resized image was saved, `False` otherwise.
+    """
+
+    try:
+        with pil.Image.open(input_path) as image:
+            # Thumbnails are saved without EXIF data, so they are rotated as the image
+            # is displayed
+            orientation = image.getexif().get(ORIENTATION_TAG)
+            transposed = orientation in TRANSPOSED_ORIENTATIONS
+            width, height = image.size[::-1] if transposed else image.size
+            # Decode the image at a reduced size if its format allows it
+            if output_size := resize_spec.output_size(width, height):
+                draft_size = _draft_size(output_size)
+                image.draft(None, draft_size[::-1] if transposed else draft_size)
+            upright = pil.ImageOps.exif_transpose(image) \
+                if orientation not in (None, 1) else image
+            output_image = resize_spec(upright, pil)
+            # Safeguard: if for some reason output_image is None, we log the error
+            if not output_image:
+                _LOGGER.error(f"renn: {output_path} couldn't be created")
+                return False
+            # The output may be a link to a cached thumbnail, which must not be
+            # modified
+            output_path.unlink(missing_ok=True)
+            output_image.save(output_path)
+            output_image.close()
+            return True
+    except OSError:
+        # If for some reason we couldn't open the image, we log the error
+        _LOGGER.error(f"renn: {input_path} couldn't be opened")
+        return False
+    except pil.Image.DecompressionBombError as e:
+        _LOGGER.error(f"renn: {input_path} couldn't be opened: {e}")
+        return False
+
+
+def _link_or_copy(source, target):
+    """
+    Hardlink a file, or copy it if it can't be linked (e.g. across filesystems).
+
+    :param source: Path of the file.
+    :param target: Path of the link or the copy.
+    """
+
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class ThumbnailCache:
+    """
+    A cache of thumbnails shared by the main site and its i18n subsites, where each
+    thumbnail is identified by the content of its image and its resize spec. A
+    thumbnail is thus computed once, then linked (or copied) to the output of every
+    site that needs it.
+    """
+
+    def __init__(self, context):
+        """
+        :param context: `BuildContext` of the build.
+        """
+
+        settings = context.main.settings
+        self.path = Path(settings["THUMBNAIL_CACHE_PATH"]
+                         or Path(settings["CACHE_PATH"])/"renn-thumbnails")
+        self.digests = dict()  # {input_path: digest}
+
+    def entry_path(self, input_path, resize, resize_spec, suffix):
+        """
+        :param input_path: Path of the image.
+        :param resize: Name of the resize spec.
+        :param resize_spec: `ResizeSpec` object.
+        :param suffix: Suffix of the thumbnail, which determines its format.
+        :return: Path of the cached thumbnail, or `None` if it can't be cached (custom
+        resize operations, unreadable images).
+        """
+
+        if resize_spec.custom_callback:
+            return None
+
+        if (digest := self.digests.get(input_path)) is None:
+            try:
+                with open(input_path, "rb") as f:
+                    digest = hashlib.file_digest(f, "sha256").hexdigest()
+            except OSError:
+                return None
+            self.digests[input_path] = digest
+        return self.path/digest[:2] \
+            / f"{digest}-{resize}-{resize_spec}-v{THUMBNAIL_VERSION}{suffix}"
+
+    def generate(self, pil, input_path, resize, resize_spec, output_path):
+        """
+        Link a thumbnail from the cache, computing it first if needed.
+
+        :param pil: The Pillow imports, as loaded by `load_pillow`.
+        :param input_path: Path of the image.
+        :param resize: Name of the resize spec.
+        :param resize_spec: `ResizeSpec` object.
+        :param output_path: Path of the thumbnail.
+        :return: `True` if the thumbnail was created, `False` otherwise.
+        """
+
+        entry_path = self.entry_path(input_path, resize, resize_spec,
+                                     output_path.suffix)
+        if not entry_path:
+            return _resize(pil, input_path, resize_spec, output_path)
+
+        if not entry_path.exists():
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            # Parallel subsites and workers may compute the same thumbnail at the same
+            # time
+            temporary = entry_path.with_name(
+                f".{os.getpid()}-{threading.get_native_id()}-{entry_path.name}"
+            )
+            if not _resize(pil, input_path, resize_spec, temporary):
+                return False
+            os.replace(temporary, entry_path)
+        else:
+            _LOGGER.debug(f"renn: {output_path} was found in the thumbnail cache")
+
+        _link_or_copy(entry_path, output_path)
+        return True
+
+
+@post_processing_stage("thumbnails")
+@profiled
 def generate_thumbnails(instance):
     """
     A post-process pass that generates thumbnails.
@@ -189,11 +549,10 @@ def generate_thumbnails(instance):
     :param instance: `Pelican` instance.
     """
 
-    global pil_imports
-
     if not instance.settings["THUMBNAIL_ENABLE"]:
         return
-    if not pil_imports:
+    context = BuildContext.of(instance.settings)
+    if not (pil := context.pil):
         _LOGGER.error("renn: 'THUMBNAIL_ENABLE' is set to True but the PIL package "
                       "was not found.")
         return
@@ -228,6 +587,22 @@ def generate_thumbnails(instance):
                                                      resize_spec)
                     paths[output_path] = (input_path, resize)
 
+    # Registered images are generated for the site they are found in; the others are
+    # handed to the main site (e.g. images of i18n subsites that link to the main site
+    # static files)
+    with context.lock:
+        images, context.images = context.images, dict()
+    for image, resizes in images.items():
+        input_path = Path(instance.settings["OUTPUT_PATH"])/image
+        if not input_path.is_file():
+            if context.main is not context:
+                register_image(context.main, image, resizes)
+            continue
+        for resize in resizes & rspecs.keys():
+            output_path = _parse_output_path(input_path, save_as, resize,
+                                             rspecs[resize])
+            paths[output_path] = (input_path, resize)
+
     # Our output files may have been picked by the walk if DELETE_OUTPUT_DIRECTORY is
     # False; we need to remove these invalid input paths if they appear in the output
     # paths
@@ -239,26 +614,115 @@ def generate_thumbnails(instance):
     for p in marked_for_deletion:
         paths.pop(p)
 
-    # Now we can generate our thumbnails
+    cache = ThumbnailCache(context) if instance.settings["THUMBNAIL_CACHE_ENABLE"] \
+        else None
+    graph = dependency_graph(instance.settings)
+    # In dry-run mode, the thumbnails are only planned
+    plan = stage_plan(instance.settings, "thumbnails")
+
+    # Now we can find the thumbnails that aren't up to date
+    candidates = []  # [(output_path, input_path, resize, inputs, reason)]
     for output_path, (input_path, resize) in paths.items():
-        if skip_existing and output_path.exists():
+        # With a dependency graph, an existing thumbnail is only kept if its image and
+        # its resize spec are unchanged, or if it was never recorded and
+        # THUMBNAIL_SKIP_EXISTING is set; custom resize operations can't be compared
+        inputs = None
+        reason = None
+        if graph and not rspecs[resize].custom_callback:
+            inputs = {
+                f"file:{input_path}": graph.file(input_path),
+                f"resize:{resize}": graph.value(str(rspecs[resize])),
+                "version": graph.value(THUMBNAIL_VERSION),
+            }
+            if not (reason := graph.check("thumbnails", output_path, inputs,
+                                          adopt=skip_existing)):
+                _LOGGER.debug(f"renn: {output_path} is up to date, was skipped")
+                if plan is not None:
+                    plan["up_to_date"].append(str(output_path))
+                continue
+        elif skip_existing and output_path.exists():
             _LOGGER.debug(f"renn: {output_path} already exists, was skipped")
+            if plan is not None:
+                plan["up_to_date"].append(str(output_path))
+            continue
+        candidates.append((output_path, input_path, resize, inputs, reason))
+
+    # The headers of their images tell whether they can be decoded, and how much
+    # memory this takes, before anything is decoded; they are read once for all the
+    # resize specs, and unreadable images are reported before any thumbnail is made
+    infos = image_metadata(instance.settings).scan(
+        dict.fromkeys(input_path for _, input_path, *_ in candidates), pil
+    )
+    for input_path, info in infos.items():
+        if not info or info.error:
+            _LOGGER.error(f"renn: {input_path} can't be thumbnailed: "
+                          f"{info.error if info else "file not found"}")
+
+    limits = {resize: _pixel_limit(instance.settings, pil, resize)
+              for resize in {resize for _, _, resize, *_ in candidates}}
+    jobs = []  # [(output_path, input_path, resize, inputs, footprint)]
+    for output_path, input_path, resize, inputs, reason in candidates:
+        info = infos[input_path]
+        if not info or info.error:
+            if plan is not None:
+                plan["refused"].append({"output": str(output_path),
+                                        "reason": info.error if info
+                                        else "file not found"})
+            continue
+        limit = limits[resize]
+        if limit and info.pixels > limit:
+            _LOGGER.error(f"renn: {input_path} has {info.pixels} pixels, over the "
+                          f"limit of {limit} for '{resize}', {output_path} was "
+                          f"skipped")
+            if plan is not None:
+                plan["refused"].append({"output": str(output_path),
+                                        "reason": f"over {limit} pixels"})
             continue
+        footprint = _memory_footprint(
+            info, rspecs[resize].output_size(*info.display_size)
+        )
+        jobs.append((output_path, input_path, resize, inputs, footprint))
+        if plan is not None:
+            plan["jobs"].append(_plan_job(
+                output_path, input_path, resize, rspecs[resize], info, footprint,
+                reason or (OUTPUT_MISSING if not output_path.exists()
+                           else "output not tracked"),
+                cache
+            ))
+
+    if plan is not None:
+        # Thumbnails in directories of their own that wouldn't be generated anymore
+        directories = {output_path.parent for output_path in paths} \
+            - {input_path.parent for input_path, _ in paths.values()}
+        plan["orphaned"] += orphaned_outputs(graph, "thumbnails", paths, directories)
+        return
+
+    budget = MemoryBudget(instance.settings["THUMBNAIL_MEMORY_BUDGET"]) \
+        if instance.settings["THUMBNAIL_MEMORY_BUDGET"] else None
 
+    def generate(output_path, input_path, resize, footprint):
         # mkdir -p the output directory
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
         # At long last, we can actually resize our image!
-        try:
-            with pil_imports.Image.open(input_path) as image:
-                output_image = rspecs[resize](image)
-                # Safeguard: if for some reason output_image is None, we log the error
-                if not output_image:
-                    _LOGGER.error(f"renn: {output_path} couldn't be created")
-                    continue
-                output_image.save(output_path)
-                output_image.close()
-                _LOGGER.info(f"renn: {output_path} was created")
-        except OSError:
-            # If for some reason we couldn't open the image, we log the error
-            _LOGGER.error(f"renn: {input_path} couldn't be opened")
+        with budget.reserve(footprint) if budget else nullcontext(), \
+                span(instance.settings, "thumbnail", "thumbnail",
+                     output=str(output_path), footprint=footprint):
+            if cache:
+                return cache.generate(pil, input_path, resize, rspecs[resize],
+                                      output_path)
+            return _resize(pil, input_path, rspecs[resize], output_path)
+
+    # Pillow releases the GIL while it decodes, resizes and encodes images
+    workers = instance.settings["THUMBNAIL_WORKERS"]
+    if workers == 1 or len(jobs) < 2:
+        created = [generate(*job[:3], job[4]) for job in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            created = list(executor.map(lambda job: generate(*job[:3], job[4]), jobs))
+
+    for (output_path, _, _, inputs, _), job_created in zip(jobs, created, strict=True):
+        if job_created:
+            _LOGGER.info(f"renn: {output_path} was created")
+            if inputs:
+                graph.record("thumbnails", output_path, inputs)
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+import logging
+import os
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _lock_writer(writer):
+    """
+    Serialize the bookkeeping of the files written by a Pelican writer, so that it can
+    be shared by several threads.
+
+    :param writer: A `pelican.writers.Writer` instance.
+    """
+
+    if hasattr(writer, "renn_lock"):
+        return
+
+    writer.renn_lock = threading.Lock()
+    open_w = writer._open_w
+
+    @wraps(open_w)
+    def locked_open_w(*args, **kwargs):
+        with writer.renn_lock:
+            return open_w(*args, **kwargs)
+
+    writer._open_w = locked_open_w
+
+
+def write_files(settings, write, jobs):
+    """
+    Write a batch of files, in a thread pool if `WRITE_WORKERS` allows it. The files
+    of a batch may be written in any order.
+
+    :param settings: Pelican settings.
+    :param write: `Writer.write_file`, possibly wrapped in a `functools.partial`.
+    :param jobs: Iterable of `(args, kwargs)` tuples to call `write` with. It is
+    consumed in the calling thread.
+    """
+
+    workers = settings["WRITE_WORKERS"]
+    # With relative URLs, the writer stores the URL of the file being written in the
+    # shared context, so that the content can adjust its links
+    if workers == 1 or settings["RELATIVE_URLS"]:
+        for args, kwargs in jobs:
+            write(*args, **kwargs)
+        return
+
+    writer = (write.func if isinstance(write, partial) else write).__self__
+    _lock_writer(writer)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(write, *args, **kwargs) for args, kwargs in jobs]
+    _LOGGER.debug(f"renn: Wrote {len(futures)} files in a thread pool")
+
+    # Propagate the first error, as a sequential write would
+    for future in futures:
+        future.result()
@@ -38,6 +38,17 @@ def tests(c, deprecations=False):
     c.run(f"{CMD_PREFIX}pytest {deprecations_flag}", pty=PTY)
 
 
+@task
+def benchmark(c, save=False, articles=100, images=20, languages=3, rounds=3):
+    """Run the benchmarks against the baseline, or record it with `--save`."""
+    save_flag = "--save" if save else ""
+    c.run(
+        f"{CMD_PREFIX}python benchmarks/run.py {save_flag} --articles {articles} "
+        f"--images {images} --languages {languages} --rounds {rounds}",
+        pty=PTY,
+    )
+
+
 @task
 def format(c, check=False, diff=False):
     """Run Ruff's auto-formatter, optionally with `--check` or `--diff`."""
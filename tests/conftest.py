@@ -0,0 +1,94 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from pelican.generators import ArticlesGenerator
+from pelican.log import LimitFilter
+from pelican.plugins.pelican_renn_plugin import set_default_settings
+from pelican.settings import read_settings
+
+
+@pytest.fixture(autouse=True)
+def log_every_message(monkeypatch):
+    """
+    Pelican's loggers drop the messages already logged, even by a previous test.
+    """
+
+    monkeypatch.setattr(LimitFilter, "_raised_messages", set())
+
+
+@pytest.fixture
+def settings(tmp_path):
+    """
+    :return: Pelican settings of a site in a temporary directory, with the default
+    settings of the plugin.
+    """
+
+    (tmp_path/"content").mkdir()
+    settings = read_settings(override={
+        "PATH": str(tmp_path/"content"),
+        "OUTPUT_PATH": str(tmp_path/"output"),
+        "CACHE_PATH": str(tmp_path/"cache"),
+        "TIMEZONE": "UTC",
+        "SITEURL": "",
+        "DEFAULT_PAGINATION": 2,
+        "FEED_ALL_ATOM": None,
+        "CATEGORY_FEED_ATOM": None,
+    })
+    set_default_settings(SimpleNamespace(settings=settings))
+    return settings
+
+
+@pytest.fixture
+def write_article(settings):
+    """
+    :return: A function that writes a reST article in the content directory.
+    """
+
+    def write(slug, day, category="work", status="published", path=None):
+        """
+        :param slug: Slug of the article.
+        :param day: Day of January 2024 the article was published.
+        :param category: Category of the article.
+        :param status: Status of the article.
+        :param path: Content directory. The default is the `PATH` of the settings.
+        """
+
+        source = (f"{slug}\n{"#" * len(slug)}\n\n"
+                  f":date: {date(2024, 1, day).isoformat()}\n"
+                  f":category: {category}\n"
+                  f":status: {status}\n\n"
+                  f"Content of {slug}.\n")
+        path = path or settings["PATH"]
+        with open(f"{path}/{slug}.rst", "w", encoding="utf-8") as f:
+            f.write(source)
+
+    return write
+
+
+@pytest.fixture
+def articles_generator():
+    """
+    :return: A function that creates an `ArticlesGenerator` for some settings, and
+    reads its articles.
+    """
+
+    def create(settings):
+        """
+        :param settings: Pelican settings.
+        :return: The `ArticlesGenerator`, once its context is generated.
+        """
+
+        context = settings.copy()
+        context["generated_content"] = dict()
+        context["static_links"] = set()
+        context["static_content"] = dict()
+        context["localsiteurl"] = settings["SITEURL"]
+        generator = ArticlesGenerator(context=context, settings=settings,
+                                      path=settings["PATH"], theme=settings["THEME"],
+                                      output_path=settings["OUTPUT_PATH"])
+        generator.generate_context()
+        return generator
+
+    return create
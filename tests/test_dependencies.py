@@ -0,0 +1,131 @@
+import pytest
+
+from pelican.plugins.pelican_renn_plugin.dependencies import (
+    NOT_BUILT,
+    OUTPUT_MISSING,
+    OUTPUT_MODIFIED,
+    DependencyGraph,
+)
+
+
+@pytest.fixture
+def files(tmp_path):
+    """
+    :return: An `(input, output)` tuple of paths, with the input written.
+    """
+
+    source = tmp_path/"input.css"
+    source.write_text("a {}")
+    return source, tmp_path/"output"/"output.css"
+
+
+def build(graph, stage, source, output, stash=False):
+    """
+    Build an output from its input, and record it in the graph.
+
+    :param graph: A `DependencyGraph`.
+    :param stage: Name of the stage.
+    :param source: Path of the input.
+    :param output: Path of the output.
+    :param stash: Whether to keep a copy of the output.
+    :return: The inputs the output was recorded with.
+    """
+
+    output.parent.mkdir(exist_ok=True)
+    output.write_text(source.read_text().upper())
+    inputs = {"file": graph.file(source), "minify": graph.value(True)}
+    graph.record(stage, output, inputs, stash=stash)
+    return inputs
+
+
+@pytest.mark.parametrize("persistent", [True, False])
+def test_up_to_date(settings, files, persistent):
+    """An output is up to date once it is recorded, and the graph is saved."""
+
+    source, output = files
+    graph = DependencyGraph(settings, persistent=persistent)
+    inputs = {"file": graph.file(source), "minify": graph.value(True)}
+    assert graph.check("css", output, inputs) == NOT_BUILT
+
+    build(graph, "css", source, output)
+    graph.save()
+    assert graph.check("css", output, inputs) is None
+    assert graph.report == {"css": {"ran": [], "skipped": 1}}
+
+    # Only a persistent graph is loaded by the next Pelican instance
+    reloaded = DependencyGraph(settings, persistent=persistent)
+    assert reloaded.check("css", output, inputs) == (None if persistent else NOT_BUILT)
+
+
+def test_changed_inputs(settings, files):
+    """An output is built again when its inputs change, and the changes are named."""
+
+    source, output = files
+    graph = DependencyGraph(settings)
+    build(graph, "css", source, output)
+    graph.save()
+
+    source.write_text("b {}")
+    inputs = {"file": graph.file(source), "minify": graph.value(False),
+              "config": graph.value(None)}
+    assert graph.check("css", output, inputs) == "changed: config, file, minify"
+    assert graph.report["css"]["ran"] == [{"output": str(output),
+                                           "reason": "changed: config, file, minify"}]
+
+
+def test_missing_or_modified_output(settings, files):
+    """An output is built again when it was deleted or modified since it was built."""
+
+    source, output = files
+    graph = DependencyGraph(settings)
+    inputs = build(graph, "css", source, output)
+    graph.save()
+
+    output.write_text("modified")
+    assert graph.check("css", output, inputs) == OUTPUT_MODIFIED
+    output.unlink()
+    assert graph.check("css", output, inputs) == OUTPUT_MISSING
+
+
+@pytest.mark.parametrize("persistent", [True, False])
+def test_restore(settings, files, persistent):
+    """A modified output is restored from the copy kept when it was recorded."""
+
+    source, output = files
+    graph = DependencyGraph(settings, persistent=persistent)
+    inputs = build(graph, "css", source, output, stash=True)
+    graph.save()
+
+    # e.g. Pelican copied the input file over the output
+    output.write_text(source.read_text())
+    assert graph.check("css", output, inputs, restore=True) is None
+    assert output.read_text() == "A {}"
+
+
+def test_adopt(settings, files):
+    """An existing output that was never recorded can be adopted."""
+
+    source, output = files
+    output.parent.mkdir()
+    output.write_text("existing")
+    graph = DependencyGraph(settings)
+    inputs = {"file": graph.file(source)}
+
+    assert graph.check("thumbnails", output, inputs, adopt=True) is None
+    graph.save()
+    assert graph.check("thumbnails", output, inputs) is None
+
+
+def test_dry_run(settings, files):
+    """A dry run doesn't restore outputs, but considers them up to date if it could."""
+
+    source, output = files
+    graph = DependencyGraph(settings)
+    inputs = build(graph, "css", source, output, stash=True)
+    graph.save()
+
+    output.write_text("modified")
+    settings["RENN_DRY_RUN"] = "plan.json"
+    dry_run_graph = DependencyGraph(settings)
+    assert dry_run_graph.check("css", output, inputs, restore=True) is None
+    assert output.read_text() == "modified"
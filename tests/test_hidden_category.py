@@ -0,0 +1,106 @@
+import pytest
+
+from pelican.paginator import Paginator
+from pelican.plugins.pelican_renn_plugin.hidden_category import (
+    HiddenCategory,
+    create_hidden_categories,
+)
+from pelican.plugins.pelican_renn_plugin.overrides import patch_articles_generator
+
+
+@pytest.fixture
+def generator(settings, write_article, articles_generator):
+    """
+    :return: A function that creates an `ArticlesGenerator` with visible and hidden
+    articles in the `work` category, and creates its hidden categories.
+    """
+
+    def create(**overrides):
+        """
+        :param overrides: Settings to override.
+        :return: The `ArticlesGenerator`.
+        """
+
+        settings.update(HIDDENCATEGORY_ENABLE=True, **overrides)
+        for day in (1, 3, 5):
+            write_article(f"visible-{day}", day)
+        for day in (2, 4):
+            write_article(f"hidden-{day}", day, status="hidden")
+        write_article("misc-6", 6, category="misc")
+        generator = articles_generator(settings)
+        create_hidden_categories(generator)
+        return generator
+
+    return create
+
+
+def hidden_categories(generator):
+    """
+    :param generator: An `ArticlesGenerator`.
+    :return: A `{slug: (category, articles)}` dictionary of its hidden categories.
+    """
+
+    return {category.slug: (category, articles)
+            for category, articles in generator.categories
+            if isinstance(category, HiddenCategory)}
+
+
+def slugs(articles):
+    """
+    :param articles: Articles.
+    :return: The slugs of the articles.
+    """
+
+    return [article.slug for article in articles]
+
+
+@pytest.mark.parametrize("order_by", ["reversed-date", "title"])
+def test_merge_order(generator, order_by):
+    """Visible and hidden articles are merged from the newest to the oldest."""
+
+    generator = generator(ARTICLE_ORDER_BY=order_by)
+
+    categories = hidden_categories(generator)
+    assert list(categories) == ["work-full"]
+    category, articles = categories["work-full"]
+    assert category.base_category.slug == "work"
+    assert slugs(articles) == ["visible-5", "hidden-4", "visible-3", "hidden-2",
+                               "visible-1"]
+    # The categories template doesn't list hidden categories
+    assert not any(isinstance(category, HiddenCategory)
+                   for category, _ in generator.context["categories"])
+
+
+def test_excluded_category(generator):
+    """Excluded categories don't get a hidden category."""
+
+    assert not hidden_categories(generator(HIDDENCATEGORY_EXCLUDES=["work"]))
+
+
+@pytest.mark.parametrize("newest_first", [True, False])
+def test_pagination(generator, newest_first):
+    """Hidden categories are paginated with dates that hold their hidden articles."""
+
+    generator = generator(NEWEST_FIRST_ARCHIVES=newest_first)
+    patch_articles_generator(generator)
+    writes = dict()
+    generator.generate_categories(
+        lambda name, template, context, **kwargs: writes.setdefault(name, kwargs)
+    )
+
+    category, articles = hidden_categories(generator)["work-full"]
+    kwargs = writes[category.save_as]
+    assert kwargs["category"] is category
+    assert kwargs["articles"] == articles
+    assert sorted(slugs(kwargs["dates"])) == sorted(slugs(articles))
+
+    # As `Writer.write_file` paginates them
+    paginators = {key: Paginator(category.save_as, category.url, kwargs[key],
+                                 generator.settings, 2)
+                  for key in ("articles", "dates")}
+    assert paginators["articles"].num_pages == paginators["dates"].num_pages == 3
+    assert slugs(paginators["articles"].page(1).object_list) == ["visible-5",
+                                                                "hidden-4"]
+    assert slugs(paginators["dates"].page(1).object_list) == (
+        ["visible-5", "hidden-4"] if newest_first else ["visible-1", "hidden-2"]
+    )
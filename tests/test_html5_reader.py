@@ -0,0 +1,160 @@
+from pathlib import Path
+import re
+
+from jinja2 import DictLoader, Environment
+import pytest
+
+from pelican.plugins.pelican_renn_plugin.context import SETTINGS_KEY, BuildContext
+from pelican.plugins.pelican_renn_plugin.html5_reader import (
+    CachedReaderMixin,
+    RstCache,
+    _cached_reader_class,
+)
+from pelican.plugins.pelican_renn_plugin.projects_directive import (
+    register_directives,
+)
+from pelican.readers import RstReader
+
+TEMPLATES = {
+    "snippets/projects.html": "<ul>{% for project in projects %}{{ project }}"
+                              "{% endfor %}</ul>",
+    "snippets/project.html": "<li>{{ project_title }}</li>",
+}
+
+SOURCE = """\
+Projects
+########
+
+.. include:: included.rst
+
+.. projects::
+
+    .. project:: My project
+        :image: images/project.jpg
+
+        Description of the project.
+"""
+
+
+@pytest.fixture
+def source(settings):
+    """
+    :return: Path of a reST source that includes a file and uses the directives.
+    """
+
+    path = Path(settings["PATH"])
+    (path/"included.rst").write_text("Included paragraph.\n")
+    (path/"projects.rst").write_text(SOURCE)
+    return path/"projects.rst"
+
+
+@pytest.fixture
+def read(settings, monkeypatch):
+    """
+    :return: A function that reads a source file in a new build, and tells whether
+    it was parsed or loaded from the reST cache.
+    """
+
+    register_directives(None)
+    settings["RST_CACHE_ENABLE"] = True
+    parsed = []
+    parse = CachedReaderMixin.parse
+
+    def spy(self, source_path):
+        parsed.append(source_path)
+        return parse(self, source_path)
+
+    monkeypatch.setattr(CachedReaderMixin, "parse", spy)
+
+    def read_source(source_path, templates=TEMPLATES, **overrides):
+        """
+        :param source_path: Path of the source file.
+        :param templates: Templates of the jinja environment.
+        :param overrides: Settings to override.
+        :return: A `(content, parsed)` tuple, with `parsed` whether the source was
+        parsed.
+        """
+
+        # Each build has its own settings and build context
+        build_settings = settings | overrides
+        build_settings.pop(SETTINGS_KEY, None)
+        context = BuildContext.of(build_settings)
+        context.jinja_env = Environment(loader=DictLoader(templates))
+        reader = _cached_reader_class(RstReader)(build_settings)
+
+        parsed.clear()
+        content, _ = reader.read(str(source_path))
+        return content, bool(parsed)
+
+    return read_source
+
+
+def test_cache_hit(read, source):
+    """An unchanged source is loaded from the cache."""
+
+    content, parsed = read(source)
+    assert parsed
+    assert "Included paragraph." in content
+    assert "<li>My project</li>" in content
+
+    assert read(source) == (content, False)
+
+
+def test_source_change(read, source):
+    """A source is parsed again when it changes."""
+
+    read(source)
+    source.write_text(SOURCE.replace("My project", "Another project"))
+
+    content, parsed = read(source)
+    assert parsed
+    assert "<li>Another project</li>" in content
+
+
+def test_template_change(read, source):
+    """A source is parsed again when a template used by its directives changes."""
+
+    read(source)
+
+    content, parsed = read(source, TEMPLATES | {
+        "snippets/project.html": "<li class='project'>{{ project_title }}</li>",
+    })
+    assert parsed
+    assert "<li class='project'>My project</li>" in content
+
+
+def test_included_file_change(read, source):
+    """A source is parsed again when a file it includes changes."""
+
+    read(source)
+    (source.parent/"included.rst").write_text("Changed paragraph.\n")
+
+    content, parsed = read(source)
+    assert parsed
+    assert "Changed paragraph." in content
+
+
+@pytest.mark.parametrize(("name", "before", "after"), [
+    ("TYPOGRIFY", False, True),
+    ("DOCUTILS_SETTINGS", {}, {"smart_quotes": True}),
+    # Objects are compared by their representation, not only by their type
+    ("PROJECTS_FRAGMENTS_PATH", Path("fragments"), Path("popovers")),
+    ("CUSTOM_PATTERN", re.compile("a"), re.compile("b")),
+])
+def test_settings_change(read, source, name, before, after):
+    """A source is parsed again when the settings change."""
+
+    read(source, **{name: before})
+    assert not read(source, **{name: before})[1]
+    assert read(source, **{name: after})[1]
+
+
+def test_base_key_ignores_addresses(settings):
+    """Settings holding objects and functions don't change the key across builds."""
+
+    keys = set()
+    for _ in range(2):
+        build_settings = settings | {"CUSTOM_OBJECT": object(),
+                                     "CUSTOM_FUNCTION": lambda value: value}
+        keys.add(RstCache(build_settings).base_key)
+    assert len(keys) == 1
@@ -0,0 +1,65 @@
+import pytest
+
+from pelican.plugins.pelican_renn_plugin.noindex_category import (
+    patch_generate_direct_templates,
+)
+
+
+@pytest.fixture
+def direct_templates(settings, write_article, articles_generator):
+    """
+    :return: A function that writes the direct templates of a site with articles in
+    the `work` and `misc` categories, and returns the `{template: kwargs}` they were
+    written with.
+    """
+
+    def write(noindex):
+        """
+        :param noindex: The `NOINDEX_CATEGORIES` setting.
+        :return: A `(generator, writes)` tuple.
+        """
+
+        settings["NOINDEX_CATEGORIES"] = noindex
+        for day, category in enumerate(["work", "misc", "work", "misc"], 1):
+            write_article(f"{category}-{day}", day, category=category)
+        generator = articles_generator(settings)
+        patch_generate_direct_templates(generator)
+        writes = dict()
+        generator.generate_direct_templates(
+            lambda name, template, context, **kwargs:
+                writes.setdefault(kwargs["template_name"], kwargs)
+        )
+        return generator, writes
+
+    return write
+
+
+def slugs(articles):
+    """
+    :param articles: Articles.
+    :return: The slugs of the articles.
+    """
+
+    return [article.slug for article in articles]
+
+
+def test_index_filtered(direct_templates):
+    """The index doesn't list the articles of no-index categories."""
+
+    generator, writes = direct_templates(["misc"])
+
+    assert slugs(writes["index"]["articles"]) == ["work-3", "work-1"]
+    # The dates are paginated along the articles
+    assert sorted(slugs(writes["index"]["dates"])) == ["work-1", "work-3"]
+    # The other direct templates list every article
+    assert writes["archives"]["articles"] == generator.articles
+    assert writes["archives"]["dates"] == generator.dates
+
+
+def test_no_noindex_categories(direct_templates):
+    """Without no-index categories, the index lists every article."""
+
+    generator, writes = direct_templates([])
+
+    assert writes["index"]["articles"] is generator.articles
+    assert writes["index"]["dates"] is generator.dates
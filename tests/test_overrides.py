@@ -0,0 +1,159 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from pelican.plugins.pelican_renn_plugin.context import SETTINGS_KEY, BuildContext
+from pelican.plugins.pelican_renn_plugin.hidden_category import (
+    HiddenCategory,
+    create_hidden_categories,
+)
+from pelican.plugins.pelican_renn_plugin.overrides import (
+    ArticleOverride,
+    CategoryOverride,
+    HiddenCategoryOverride,
+    check_overrides,
+    collect_override_matches,
+    compile_overrides,
+    override_context,
+    report_unused_overrides,
+)
+
+
+@pytest.fixture
+def site(settings, write_article, articles_generator):
+    """
+    :return: A function that reads the articles of a site with some overrides, and
+    records which overrides matched them.
+    """
+
+    write_article("article", 1)
+    write_article("hidden", 2, status="hidden")
+
+    def build(overrides, site_settings=None):
+        """
+        :param overrides: The `OVERRIDES` setting.
+        :param site_settings: Pelican settings of the site. The default is the
+        settings of the main site.
+        :return: The `ArticlesGenerator` of the site.
+        """
+
+        site_settings = settings if site_settings is None else site_settings
+        site_settings.update(OVERRIDES=overrides, HIDDENCATEGORY_ENABLE=True)
+        compile_overrides(SimpleNamespace(settings=site_settings))
+        generator = articles_generator(site_settings)
+        create_hidden_categories(generator)
+        check_overrides([generator])
+        return generator
+
+    return build
+
+
+def unused_overrides(caplog, settings):
+    """
+    :param caplog: The `caplog` fixture.
+    :param settings: Pelican settings of the main site.
+    :return: The messages of the unused overrides reported once the build is done.
+    """
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        report_unused_overrides(SimpleNamespace(settings=settings))
+    return [record.getMessage() for record in caplog.records]
+
+
+def test_invalid_overrides(settings, caplog):
+    """Invalid overrides are reported and ignored."""
+
+    settings["OVERRIDES"] = {
+        ("article", "Article"): {"SITENAME": "Article"},
+        ("article", "Unknown"): {"SITENAME": "Unknown"},
+        "article": {"SITENAME": "Not a tuple"},
+        ("article", "Page"): "Not a mapping",
+    }
+    with caplog.at_level(logging.WARNING):
+        compile_overrides(SimpleNamespace(settings=settings))
+
+    assert list(BuildContext.of(settings).overrides) == [("article", "Article")]
+    assert len(caplog.records) == 3
+
+
+def test_override_context(site):
+    """An override is layered over the generator context, which isn't modified."""
+
+    generator = site({("article", "Article"): {"SITENAME": "Article"},
+                      ("work", "HiddenCategory"): {"SITENAME": "All work"}})
+    article, = generator.articles
+    category, hidden_category = (category for category, _ in generator.categories)
+    assert isinstance(hidden_category, HiddenCategory)
+
+    context = override_context(ArticleOverride, article, generator)
+    assert context["SITENAME"] == "Article"
+    context["written"] = True
+    assert "written" not in generator.context
+    assert generator.context["SITENAME"] != "Article"
+
+    # Hidden categories are matched by the slug of their base category
+    assert override_context(HiddenCategoryOverride, hidden_category,
+                            generator)["SITENAME"] == "All work"
+    assert override_context(CategoryOverride, category,
+                            generator) is generator.context
+
+
+def test_unused_overrides(site, settings, caplog):
+    """Only the overrides that don't match any object are reported, once."""
+
+    site({("article", "Article"): {"SITENAME": "Article"},
+          ("hidden", "Article"): {"SITENAME": "Hidden"},
+          ("work", "HiddenCategory"): {"SITENAME": "All work"},
+          ("index", "DirectTemplate"): {"SITENAME": "Home"},
+          ("missing", "Article"): {"SITENAME": "Missing"},
+          ("article", "Tag"): {"SITENAME": "Tag"}})
+
+    assert unused_overrides(caplog, settings) == [
+        "renn: Override ('article', 'Tag') doesn't match any object",
+        "renn: Override ('missing', 'Article') doesn't match any object",
+    ]
+    # The next build of the same Pelican instance starts over
+    assert unused_overrides(caplog, settings) == []
+
+
+def test_subsite_overrides(site, settings, write_article, tmp_path, caplog):
+    """Overrides that only match an object of a subsite aren't reported."""
+
+    site({("article", "Article"): {"SITENAME": "Article"},
+          ("translated", "Article"): {"SITENAME": "Translated"}})
+    # i18n subsites copy the settings of the main site
+    subsite_settings = settings.copy()
+    subsite_settings["PATH"] = str(tmp_path/"content-fr")
+    (tmp_path/"content-fr").mkdir()
+    write_article("translated", 1, path=subsite_settings["PATH"])
+    site({("translated", "Article"): {"SITENAME": "Traduit"},
+          ("missing", "Article"): {"SITENAME": "Manquant"}}, subsite_settings)
+
+    assert BuildContext.of(subsite_settings).main is BuildContext.of(settings)
+    assert unused_overrides(caplog, settings) == [
+        "renn: Override ('missing', 'Article') doesn't match any object",
+    ]
+
+
+def test_parallel_subsite_overrides(site, settings, write_article, tmp_path,
+                                    caplog):
+    """Subsites built in a worker process hand their overrides back."""
+
+    site({("translated", "Article"): {"SITENAME": "Translated"}})
+    # A worker process has its own copy of the build context of the main site
+    subsite_settings = settings.copy()
+    subsite_settings.pop(SETTINGS_KEY)
+    subsite_settings["PATH"] = str(tmp_path/"content-fr")
+    (tmp_path/"content-fr").mkdir()
+    write_article("translated", 1, path=subsite_settings["PATH"])
+    site({("translated", "Article"): {"SITENAME": "Traduit"},
+          ("missing", "Article"): {"SITENAME": "Manquant"}}, subsite_settings)
+
+    merge = collect_override_matches(SimpleNamespace(settings=subsite_settings))
+    merge(SimpleNamespace(settings=settings))
+
+    assert unused_overrides(caplog, settings) == [
+        "renn: Override ('missing', 'Article') doesn't match any object",
+    ]
@@ -0,0 +1,116 @@
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+
+from docutils.utils import DependencyList
+import pytest
+
+from pelican.plugins.pelican_renn_plugin.context import BuildContext
+from pelican.plugins.pelican_renn_plugin.projects_directive import image_variants
+from pelican.plugins.pelican_renn_plugin.thumbnail import load_pillow
+
+Image = pytest.importorskip("PIL.Image")
+
+# EXIF orientation of an image rotated by 90 degrees
+ROTATED = 6
+
+
+@pytest.fixture
+def variants(settings):
+    """
+    :return: A function that writes a project image in the content directory, and
+    computes its variants.
+    """
+
+    settings.update(
+        THUMBNAIL_ENABLE=True,
+        THUMBNAIL_RESIZES={
+            "square": (150, True),
+            "deformed": (150, 100),
+            "wide": (150, None, True),
+            "half": (400, None, True),
+            "huge": (2000, None, True),
+        },
+        PROJECTS_IMAGE_RESIZES=["square", "deformed", "wide", "half", "huge"],
+    )
+    load_pillow(SimpleNamespace(settings=settings))
+    context = BuildContext.of(settings)
+
+    def compute(uri, orientation=None, document_settings=None):
+        """
+        :param uri: URI of the image in the `image` option.
+        :param orientation: EXIF orientation of the image.
+        :param document_settings: docutils settings of the document.
+        :return: The result of `image_variants`.
+        """
+
+        path = Path(settings["PATH"])/"images"/"photo.jpg"
+        path.parent.mkdir(exist_ok=True)
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        Image.new("RGB", (800, 600)).save(path, exif=exif)
+        with context.activate():
+            return image_variants(uri, document_settings)
+
+    return compute
+
+
+def test_srcset(variants, settings, caplog):
+    """Only the variants that keep the aspect ratio of the image are candidates."""
+
+    with caplog.at_level(logging.WARNING):
+        srcset, width, height = variants("images/photo.jpg")
+
+    assert (width, height) == (800, 600)
+    # A variant can't be larger than the image, which is a candidate itself
+    assert srcset == [("images/thumbnails/photo_wide.jpg", 150),
+                      ("images/thumbnails/photo_half.jpg", 400),
+                      ("images/photo.jpg", 800)]
+    assert sorted(record.getMessage().split("'")[1]
+                  for record in caplog.records) == ["deformed", "square"]
+    # Cropped and deformed thumbnails aren't generated for the tile
+    assert BuildContext.of(settings).images == {
+        "images/photo.jpg": {"wide", "half", "huge"},
+    }
+
+
+def test_root_relative_uri(variants):
+    """Root-relative URIs are resolved like relative ones."""
+
+    assert variants("/images/photo.jpg") == variants("images/photo.jpg")
+
+
+def test_absolute_url(variants, settings):
+    """Images hosted elsewhere have no variants."""
+
+    assert variants("https://example.com/images/photo.jpg") == ([], None, None)
+    assert not BuildContext.of(settings).images
+
+
+def test_orientation(variants):
+    """Images are measured as they are displayed."""
+
+    srcset, width, height = variants("images/photo.jpg", orientation=ROTATED)
+
+    assert (width, height) == (600, 800)
+    assert [width for _, width in srcset] == [150, 400, 600]
+
+
+def test_dependency(variants, settings):
+    """The image is a dependency of the document, for the reST cache."""
+
+    document_settings = SimpleNamespace(record_dependencies=DependencyList())
+    variants("images/photo.jpg", document_settings=document_settings)
+
+    assert document_settings.record_dependencies.list == [
+        str(Path(settings["PATH"])/"images"/"photo.jpg"),
+    ]
+
+
+def test_disabled(variants, settings):
+    """Without thumbnails, project images have no variants."""
+
+    settings["THUMBNAIL_ENABLE"] = False
+
+    assert variants("images/photo.jpg") == ([], None, None)